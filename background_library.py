@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Tuple
+
+from PIL import Image
+
+from disk_cache import CACHE_DIR, connect_sqlite
+from settings import get_settings
+
+BACKGROUND_CACHE_MAX_BYTES = get_settings().background_cache_max_bytes
+
+
+class BackgroundLibrary:
+    """Content-addressed store of generated backgrounds.
+
+    Each PNG is keyed by a hash of (niche, holiday, style variant, seed) and indexed in
+    SQLite. When the library grows past `max_bytes`, the least recently used images
+    are deleted.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: int = BACKGROUND_CACHE_MAX_BYTES):
+        self.directory = directory or os.path.join(CACHE_DIR, "backgrounds")
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, "index.sqlite3")
+        self._lock = threading.Lock()
+        with connect_sqlite(self.path) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS backgrounds ("
+                "key TEXT PRIMARY KEY, niche TEXT NOT NULL, holiday TEXT NOT NULL, variant INTEGER NOT NULL, "
+                "seed INTEGER NOT NULL, file TEXT NOT NULL, bytes INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS backgrounds_lookup ON backgrounds (niche, holiday, variant, last_used)")
+
+    @staticmethod
+    def make_key(niche: str, holiday: Optional[str], variant: int, seed: int) -> str:
+        payload = json.dumps([niche, holiday or "", variant, seed])
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _open(self, key: str, file_name: str) -> Optional[Image.Image]:
+        try:
+            with Image.open(os.path.join(self.directory, file_name)) as img:
+                image = img.convert("RGBA")
+        except OSError:
+            # Index entry outlived its file (manual cleanup, partial write)
+            with connect_sqlite(self.path) as conn:
+                conn.execute("DELETE FROM backgrounds WHERE key = ?", (key,))
+            return None
+        with connect_sqlite(self.path) as conn:
+            conn.execute("UPDATE backgrounds SET last_used = ? WHERE key = ?", (time.time(), key))
+        return image
+
+    def get(self, niche: str, holiday: Optional[str], variant: int, seed: int) -> Optional[Image.Image]:
+        key = self.make_key(niche, holiday, variant, seed)
+        with connect_sqlite(self.path) as conn:
+            row = conn.execute("SELECT file FROM backgrounds WHERE key = ?", (key,)).fetchone()
+        return self._open(key, row[0]) if row else None
+
+    def find(self, niche: str, holiday: Optional[str], variant: int) -> Optional[Tuple[int, Image.Image]]:
+        """Return (seed, image) of the most recently used background for this niche/holiday/variant."""
+        with connect_sqlite(self.path) as conn:
+            row = conn.execute(
+                "SELECT key, seed, file FROM backgrounds WHERE niche = ? AND holiday = ? AND variant = ? "
+                "ORDER BY last_used DESC LIMIT 1",
+                (niche, holiday or "", variant),
+            ).fetchone()
+        if not row:
+            return None
+        image = self._open(row[0], row[2])
+        return (row[1], image) if image is not None else None
+
+    def put(self, niche: str, holiday: Optional[str], variant: int, seed: int, image: Image.Image):
+        key = self.make_key(niche, holiday, variant, seed)
+        file_name = f"{key}.png"
+        file_path = os.path.join(self.directory, file_name)
+        tmp_path = f"{file_path}.{threading.get_ident()}.tmp"
+        image.save(tmp_path, format="PNG")
+        os.replace(tmp_path, file_path)
+        with self._lock, connect_sqlite(self.path) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO backgrounds (key, niche, holiday, variant, seed, file, bytes, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, niche, holiday or "", variant, seed, file_name, os.path.getsize(file_path), time.time()),
+            )
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection):
+        total = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM backgrounds").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, file_name, size in conn.execute("SELECT key, file, bytes FROM backgrounds ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM backgrounds WHERE key = ?", (key,))
+            try:
+                os.remove(os.path.join(self.directory, file_name))
+            except OSError:
+                pass
+            total -= size
+
+    def stats(self):
+        with connect_sqlite(self.path) as conn:
+            count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM backgrounds").fetchone()
+        return {"entries": count, "bytes": total, "max_bytes": self.max_bytes}
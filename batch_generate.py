@@ -0,0 +1,246 @@
+"""Headless batch generation: posts for a niche x date matrix in one run.
+
+Example:
+    python batch_generate.py --days 7 --out-dir batch_output
+    python batch_generate.py --niches "Family Law" "Tax Law" --start 2025-12-01 --end 2025-12-31
+    python batch_generate.py --days 30 --image-engine local   # drafts with local backgrounds
+
+Progress is checkpointed to <out-dir>/manifest.json after every step, so rerunning the
+same command resumes an interrupted run. A manifest.csv is written next to the PNGs.
+"""
+import argparse
+import csv
+import datetime
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+from content_api import LEGAL_NICHES, LLM_BATCH_SIZE, RequestContext, get_post_ideas_batch, get_uae_holidays_between
+from pipeline import IMAGE_MAX_CONCURRENCY, render_post
+
+
+class Throttle:
+    """Context manager bounding concurrency and start rate of calls to one upstream."""
+
+    def __init__(self, max_concurrent: int, rate_per_second: Optional[float] = None):
+        self._slots = threading.BoundedSemaphore(max(1, max_concurrent))
+        self._interval = 1.0 / rate_per_second if rate_per_second else 0.0
+        self._next_start = 0.0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self._slots.acquire()
+        if self._interval:
+            with self._lock:
+                now = time.monotonic()
+                start = max(now, self._next_start)
+                self._next_start = start + self._interval
+            if start > now:
+                time.sleep(start - now)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._slots.release()
+
+
+class BatchManifest:
+    """Checkpointed record of a batch run, stored as <out_dir>/manifest.json."""
+
+    def __init__(self, out_dir: str):
+        self.out_dir = out_dir
+        self.path = os.path.join(out_dir, "manifest.json")
+        self._lock = threading.Lock()
+        self.items: Dict[str, Dict] = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.items = json.load(f).get("items", {})
+
+    @staticmethod
+    def key(niche: str, day: datetime.date) -> str:
+        return f"{niche}|{day.isoformat()}"
+
+    def is_complete(self, key: str) -> bool:
+        item = self.items.get(key)
+        if not item or not item.get("posts"):
+            return False
+        return all(p.get("image") and os.path.exists(os.path.join(self.out_dir, p["image"])) for p in item["posts"])
+
+    def update(self, key: str, **fields):
+        with self._lock:
+            self.items.setdefault(key, {}).update(fields)
+            self._save()
+
+    def set_image(self, key: str, index: int, image: Optional[str], error: Optional[str] = None):
+        with self._lock:
+            post = self.items[key]["posts"][index]
+            post["image"] = image
+            post["error"] = error
+            self._save()
+
+    def _save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"items": self.items}, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def write_csv(self) -> str:
+        csv_path = os.path.join(self.out_dir, "manifest.csv")
+        with open(csv_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["niche", "date", "holiday_name", "trending", "post_index", "text", "image", "error"])
+            for key in sorted(self.items):
+                item = self.items[key]
+                for post in item.get("posts") or [{"index": None, "text": None, "image": None, "error": item.get("error")}]:
+                    writer.writerow([
+                        item.get("niche"), item.get("date"), item.get("holiday_name"), item.get("trending"),
+                        post.get("index"), post.get("text"), post.get("image"), post.get("error"),
+                    ])
+        return csv_path
+
+
+def _slug(text: str) -> str:
+    return text.replace(" ", "_").lower()
+
+
+def run_batch(
+    niches: List[str],
+    dates: List[datetime.date],
+    num_posts: int = 2,
+    out_dir: str = "batch_output",
+    llm_concurrency: int = 2,
+    llm_batch_size: int = LLM_BATCH_SIZE,
+    image_concurrency: int = IMAGE_MAX_CONCURRENCY,
+    rate_limit: Optional[float] = 1.0,
+    cache_policy: Optional[str] = None,
+    engine: Optional[str] = None,
+) -> BatchManifest:
+    """Generate posts and images for every (niche, date) pair, resuming from out_dir/manifest.json."""
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = BatchManifest(out_dir)
+    # One bulk lookup warms the holiday index for the whole range
+    get_uae_holidays_between(min(dates), max(dates))
+    llm_throttle = Throttle(llm_concurrency, rate_limit)
+    image_throttle = Throttle(image_concurrency, rate_limit)
+    contexts: Dict[str, RequestContext] = {}
+
+    def generate_texts(keys: List[str]) -> List[Dict]:
+        """Resolve contexts and generate posts for a group of items with one batched LLM request."""
+        batch_contexts = [contexts[key].resolve() for key in keys]
+        needs_text = [i for i, key in enumerate(keys) if not manifest.items.get(key, {}).get("posts")]
+        if needs_text:
+            with llm_throttle:
+                results = get_post_ideas_batch([batch_contexts[i] for i in needs_text], num_posts=num_posts, batch_size=len(needs_text))
+            for i, posts in zip(needs_text, results):
+                key, context = keys[i], batch_contexts[i]
+                if isinstance(posts, dict):
+                    manifest.update(key, niche=context["niche"], date=context["date"], error=posts.get("error"))
+                    continue
+                manifest.update(
+                    key,
+                    niche=context["niche"],
+                    date=context["date"],
+                    holiday_name=context.get("holiday_name"),
+                    trending=None if context.get("is_holiday") else context.get("trending"),
+                    posts=[{"index": j, "text": text, "image": None, "error": None} for j, text in enumerate(posts)],
+                    error=None,
+                )
+        return batch_contexts
+
+    def generate_image(key: str, context: Dict, index: int, text: str):
+        item = manifest.items[key]
+        file_name = f"{item['date']}_{_slug(item['niche'])}_{index + 1}.png"
+        render_post(context, text, index, output_path=os.path.join(out_dir, file_name), inference_slots=image_throttle,
+                    cache_policy=cache_policy, engine=engine)
+        return file_name
+
+    pending = [(niche, day) for day in dates for niche in niches if not manifest.is_complete(manifest.key(niche, day))]
+    print(f"{len(niches) * len(dates) - len(pending)} of {len(niches) * len(dates)} items already done; generating {len(pending)}.")
+    for niche, day in pending:
+        contexts[manifest.key(niche, day)] = RequestContext(niche, date_override=day)
+    pending_keys = list(contexts)
+    batch_size = max(1, llm_batch_size)
+    groups = [pending_keys[i:i + batch_size] for i in range(0, len(pending_keys), batch_size)]
+
+    with ThreadPoolExecutor(max_workers=max(1, llm_concurrency)) as llm_pool, \
+            ThreadPoolExecutor(max_workers=max(1, image_concurrency) + 2) as image_pool:
+        text_futures = {llm_pool.submit(generate_texts, keys): keys for keys in groups}
+        image_futures = {}
+        # Start each group's images as soon as its text is ready
+        for future in as_completed(text_futures):
+            keys = text_futures[future]
+            try:
+                batch_contexts = future.result()
+            except Exception as e:
+                print(f"Text generation failed for {', '.join(keys)}: {e}")
+                continue
+            for key, context in zip(keys, batch_contexts):
+                item = manifest.items.get(key, {})
+                if not item.get("posts"):
+                    print(f"Text generation failed for {key}: {item.get('error')}")
+                    continue
+                for post in item["posts"]:
+                    if post.get("image") and os.path.exists(os.path.join(out_dir, post["image"])):
+                        continue
+                    image_future = image_pool.submit(generate_image, key, context, post["index"], post["text"])
+                    image_futures[image_future] = (key, post["index"])
+        for future in as_completed(image_futures):
+            key, index = image_futures[future]
+            try:
+                manifest.set_image(key, index, future.result())
+            except Exception as e:
+                print(f"Image generation failed for {key} post {index + 1}: {e}")
+                manifest.set_image(key, index, None, str(e))
+    manifest.write_csv()
+    return manifest
+
+
+def _parse_date(value: str) -> datetime.date:
+    return datetime.date.fromisoformat(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate posts for many niches and dates without the UI.")
+    parser.add_argument("--niches", nargs="+", default=LEGAL_NICHES, choices=LEGAL_NICHES, help="Legal niches (default: all)")
+    parser.add_argument("--start", type=_parse_date, default=datetime.date.today(), help="First date, YYYY-MM-DD (default: today)")
+    parser.add_argument("--end", type=_parse_date, help="Last date, YYYY-MM-DD (overrides --days)")
+    parser.add_argument("--days", type=int, default=7, help="Number of days starting at --start (default: 7)")
+    parser.add_argument("--num-posts", type=int, default=2, help="Posts per niche and date (default: 2)")
+    parser.add_argument("--out-dir", default="batch_output", help="Output directory for PNGs and the manifest")
+    parser.add_argument("--llm-concurrency", type=int, default=2, help="Concurrent OpenRouter requests (default: 2)")
+    parser.add_argument("--llm-batch-size", type=int, default=LLM_BATCH_SIZE, help="Niche/date items per structured LLM request")
+    parser.add_argument("--image-concurrency", type=int, default=IMAGE_MAX_CONCURRENCY, help="Concurrent HuggingFace requests")
+    parser.add_argument("--rate-limit", type=float, default=1.0, help="Max request starts per second per upstream; 0 disables")
+    parser.add_argument("--background-cache", choices=["off", "fresh", "reuse"], help="Background library policy (default: BACKGROUND_CACHE_POLICY)")
+    parser.add_argument("--image-engine", choices=["remote", "local"],
+                        help="remote: SDXL; local: procedural backgrounds, no API calls (default: IMAGE_ENGINE)")
+    args = parser.parse_args(argv)
+
+    if args.days < 1:
+        parser.error("--days must be at least 1")
+    if args.num_posts < 1:
+        parser.error("--num-posts must be at least 1")
+    end = args.end or args.start + datetime.timedelta(days=args.days - 1)
+    if end < args.start:
+        parser.error("--end must not be before --start")
+    dates = [args.start + datetime.timedelta(days=i) for i in range((end - args.start).days + 1)]
+    manifest = run_batch(
+        args.niches,
+        dates,
+        num_posts=args.num_posts,
+        out_dir=args.out_dir,
+        llm_concurrency=args.llm_concurrency,
+        llm_batch_size=args.llm_batch_size,
+        image_concurrency=args.image_concurrency,
+        rate_limit=args.rate_limit or None,
+        cache_policy=args.background_cache,
+        engine=args.image_engine,
+    )
+    done = sum(1 for key in manifest.items if manifest.is_complete(key))
+    print(f"Done: {done}/{len(manifest.items)} items complete. Manifest: {manifest.path}")
+
+
+if __name__ == "__main__":
+    main()
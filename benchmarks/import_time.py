@@ -0,0 +1,88 @@
+"""Import-time and Streamlit rerun benchmark.
+
+Each module is imported in a fresh interpreter with `-X importtime`, so results reflect a
+cold start; the median over `--runs` is reported along with the heaviest direct imports.
+`--rerun` also times the app script with Streamlit's AppTest: the first run and the
+median of the reruns that follow, which is what every widget interaction pays.
+
+Run from the repository root:
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --modules generate_posts content_api --runs 10 --rerun
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+MODULES = ["generate_posts", "content_api", "pipeline", "scheduler", "batch_generate", "reminder"]
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s+)(\S+)$")
+
+
+def import_profile(module: str) -> Tuple[float, Dict[str, float]]:
+    """Import `module` in a new interpreter; return (cumulative seconds, {direct import: seconds})."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    total, direct = 0.0, {}
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        cumulative, indent, name = int(match.group(2)) / 1e6, len(match.group(3)), match.group(4)
+        if name == module and indent == 1:
+            total = cumulative
+        elif indent == 3:
+            direct[name] = cumulative
+    return total, direct
+
+
+def rerun_times(script: str, reruns: int) -> Tuple[float, float]:
+    """Seconds for the first AppTest run of `script` and the median of `reruns` reruns."""
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(os.path.join(ROOT, script), default_timeout=120)
+    started = time.perf_counter()
+    app.run()
+    first = time.perf_counter() - started
+    samples = []
+    for _ in range(reruns):
+        started = time.perf_counter()
+        app.run()
+        samples.append(time.perf_counter() - started)
+    return first, statistics.median(samples)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold import time and Streamlit rerun overhead.")
+    parser.add_argument("--modules", nargs="+", default=MODULES, help="Modules to import (default: the app and CLIs)")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per module (default: 5)")
+    parser.add_argument("--top", type=int, default=5, help="Heaviest direct imports to list (default: 5)")
+    parser.add_argument("--rerun", action="store_true", help="Also time generate_posts.py reruns with AppTest")
+    args = parser.parse_args(argv)
+
+    print(f"{'module':<18}{'median ms':>11}{'min ms':>9}   heaviest direct imports")
+    for module in args.modules:
+        totals: List[float] = []
+        heaviest: Dict[str, List[float]] = {}
+        for _ in range(args.runs):
+            total, direct = import_profile(module)
+            totals.append(total)
+            for name, seconds in direct.items():
+                heaviest.setdefault(name, []).append(seconds)
+        top = sorted(((statistics.median(v), k) for k, v in heaviest.items()), reverse=True)[:args.top]
+        listed = ", ".join(f"{name} {seconds * 1000:.0f}" for seconds, name in top)
+        print(f"{module:<18}{statistics.median(totals) * 1000:>11.1f}{min(totals) * 1000:>9.1f}   {listed}")
+
+    if args.rerun:
+        first, rerun = rerun_times("generate_posts.py", args.runs)
+        print(f"\ngenerate_posts.py first run {first * 1000:.0f} ms, median rerun {rerun * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""Offline benchmark and profiling harness.
+
+Every external API is replaced by the replay stubs in benchmarks/stubs.py, so runs are
+repeatable and need no keys or network. Each stage reports p50/p95 latency, throughput
+and peak Python memory; results can be saved as a baseline and later runs compared
+against it, failing when a stage regresses past the threshold.
+
+Run from the repository root:
+    python -m benchmarks.run
+    python -m benchmarks.run --iterations 10 --latency huggingface=0.5 --latency openrouter=0
+    python -m benchmarks.run --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run --compare benchmarks/baseline.json --threshold 0.2
+    python -m benchmarks.run --only end_to_end --profile
+"""
+import argparse
+import cProfile
+import datetime
+import json
+import math
+import os
+import pstats
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+from benchmarks.stubs import DEFAULT_LATENCY, StubServers, fixture_gnews
+
+BENCHMARKS = ["news_cold", "news_warm", "post_ideas", "post_ideas_stream", "background", "overlay", "export", "end_to_end"]
+
+
+def _percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def measure(fn: Callable[[int], object], iterations: int) -> Dict[str, float]:
+    """Call fn(i) `iterations` times; return latency percentiles, throughput and peak traced memory."""
+    durations = []
+    tracemalloc.start()
+    started = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        fn(i)
+        durations.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "iterations": iterations,
+        "p50": _percentile(durations, 0.50),
+        "p95": _percentile(durations, 0.95),
+        "mean": sum(durations) / len(durations),
+        "throughput": iterations / elapsed if elapsed else 0.0,
+        "peak_kib": peak / 1024,
+    }
+
+
+def _build_benchmarks(tmp_dir: str) -> Dict[str, Callable[[int], object]]:
+    # Project modules read their endpoints at import time, so import only after the env is set
+    import content_api
+    from huggingface_api import generate_image_from_context
+    from img_overlay import export_post_image, render_post_image, write_text_on_image
+    from job_queue import job_queue
+    from slack_outbox import slack_outbox
+
+    today = datetime.date.today()
+    niche = content_api.LEGAL_NICHES[0]
+    context = content_api.RequestContext(niche, date_override=today).resolve()
+    posts = content_api.get_post_ideas(niche, num_posts=2, context=context)
+    if isinstance(posts, dict):
+        raise RuntimeError(f"Stubbed post generation failed: {posts.get('error')}")
+    background = generate_image_from_context(context, posts[0], 0, cache_policy="off")
+    rendered = render_post_image(background, posts[0], is_holiday=context["is_holiday"])
+    run_id = int(time.time())
+
+    def news_cold(i):
+        # A niche the cache has never seen forces a fresh scrape every iteration
+        return content_api.fetch_trending_article(f"Benchmark Law {run_id} {i}", today)
+
+    def news_warm(i):
+        return content_api.fetch_trending_article(niche, today)
+
+    def post_ideas(i):
+        return content_api.get_post_ideas(niche, num_posts=2, context=context)
+
+    def post_ideas_stream(i):
+        return list(content_api.stream_post_ideas(niche, num_posts=2, context=context))
+
+    def background_image(i):
+        return generate_image_from_context(context, posts[i % len(posts)], i, cache_policy="off")
+
+    def overlay(i):
+        return write_text_on_image(background, posts[i % len(posts)], os.path.join(tmp_dir, "overlay.png"),
+                                   is_holiday=context["is_holiday"], style_variant=i)
+
+    def export(i):
+        return export_post_image(rendered)
+
+    def end_to_end(i):
+        # Submitted like a "Generate Posts" click: queued, run by a job worker through run_generation
+        # (ready queue, streamed posts, shared image slots), then delivered by the Slack outbox.
+        # Each iteration takes a new date, so neither the job dedup nor the delivery key can reuse an earlier run.
+        job = job_queue().submit(content_api.LEGAL_NICHES[i % len(content_api.LEGAL_NICHES)],
+                                 today + datetime.timedelta(days=i), stream=True, export_format="PNG")
+        while not job.finished:
+            job.wait(job.version, timeout=1)
+        if job.status == "failed" or job.image_errors:
+            raise RuntimeError(job.error or next(iter(job.image_errors.values())))
+        outbox = slack_outbox()
+        while True:
+            delivery = outbox.status(job.delivery_id)
+            if delivery["status"] in ("sent", "failed"):
+                return delivery
+            # Sends inline unless the sender thread has already claimed it, so the send is part of the measurement
+            outbox.process_due()
+            time.sleep(0.005)
+
+    return {
+        "news_cold": news_cold,
+        "news_warm": news_warm,
+        "post_ideas": post_ideas,
+        "post_ideas_stream": post_ideas_stream,
+        "background": background_image,
+        "overlay": overlay,
+        "export": export,
+        "end_to_end": end_to_end,
+    }
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], threshold: float) -> List[str]:
+    """Return a message for every stage whose p50 or p95 is more than `threshold` slower than the baseline."""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        for metric in ("p50", "p95"):
+            if previous[metric] > 0 and current[metric] > previous[metric] * (1 + threshold):
+                change = current[metric] / previous[metric] - 1
+                regressions.append(f"{name} {metric}: {previous[metric] * 1000:.1f}ms -> {current[metric] * 1000:.1f}ms (+{change:.0%})")
+    return regressions
+
+
+def _print_results(results: Dict[str, Dict[str, float]]):
+    print(f"{'stage':<20}{'p50 ms':>10}{'p95 ms':>10}{'ops/s':>10}{'peak KiB':>12}")
+    for name, r in results.items():
+        print(f"{name:<20}{r['p50'] * 1000:>10.1f}{r['p95'] * 1000:>10.1f}{r['throughput']:>10.2f}{r['peak_kib']:>12.0f}")
+
+
+def _parse_latency(values: List[str]) -> Dict[str, float]:
+    latency = {}
+    for value in values:
+        service, _, seconds = value.partition("=")
+        if service not in DEFAULT_LATENCY or not seconds:
+            raise SystemExit(f"--latency expects SERVICE=SECONDS with SERVICE in {', '.join(DEFAULT_LATENCY)}")
+        latency[service] = float(seconds)
+    return latency
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage against offline API stand-ins.")
+    parser.add_argument("--iterations", type=int, default=5, help="Iterations per stage (default: 5)")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, help="Run only these stages")
+    parser.add_argument("--latency", action="append", default=[], metavar="SERVICE=SECONDS",
+                        help=f"Override stub latency; services: {', '.join(DEFAULT_LATENCY)}")
+    parser.add_argument("--save-baseline", metavar="PATH", help="Write results as JSON for later comparison")
+    parser.add_argument("--compare", metavar="PATH", help="Compare against a saved baseline; exit 1 on regression")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown before a regression (default: 0.2 = 20%%)")
+    parser.add_argument("--profile", action="store_true", help="Print the top cProfile entries for each stage")
+    args = parser.parse_args(argv)
+
+    latency = _parse_latency(args.latency)
+    tmp_dir = tempfile.mkdtemp(prefix="bench_")
+    with StubServers(latency) as stubs:
+        # The stubs replay the same posts every call; with dedup on, later iterations would only see repeats
+        os.environ.update(stubs.env(), CACHE_DIR=os.path.join(tmp_dir, "cache"), POST_DEDUP_THRESHOLD="0")
+        import content_api
+        fixture_client = fixture_gnews(stubs.latency["gnews"])()
+        content_api._gnews_client = lambda period=None: fixture_client
+        try:
+            benchmarks = _build_benchmarks(tmp_dir)
+            results = {}
+            for name in args.only or BENCHMARKS:
+                profiler = cProfile.Profile() if args.profile else None
+                if profiler:
+                    profiler.enable()
+                results[name] = measure(benchmarks[name], args.iterations)
+                if profiler:
+                    profiler.disable()
+                    print(f"\n--- {name} ---")
+                    pstats.Stats(profiler).sort_stats("cumulative").print_stats(15)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        print(f"\nStub requests: {dict(stubs.requests)}")
+    _print_results(results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"latency": stubs.latency, "results": results}, f, indent=2)
+        print(f"Saved baseline to {args.save_baseline}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline["results"], args.threshold)
+        if regressions:
+            print("Regressions:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"No stage regressed more than {args.threshold:.0%}.")
+
+
+if __name__ == "__main__":
+    main()
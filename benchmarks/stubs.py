@@ -0,0 +1,234 @@
+"""Offline stand-ins for every external service, replaying recorded responses with configurable latency.
+
+One local HTTP server answers for OpenRouter, HuggingFace, Nager.Date and Slack; Google News
+is replaced by a GNews class that returns recorded search results. Point the app at them via
+`StubServers.env()` before importing any project module.
+"""
+import copy
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from typing import Dict, Optional
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Seconds per request, roughly what each upstream costs on a good day
+DEFAULT_LATENCY = {
+    "openrouter": 0.8,
+    "huggingface": 2.0,
+    "nager": 0.15,
+    "slack": 0.1,
+    "gnews": 0.4,
+}
+
+
+def load_fixture(name: str):
+    with open(os.path.join(FIXTURES_DIR, name), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _background_png(size: int = 1024) -> bytes:
+    from PIL import Image
+
+    image = Image.linear_gradient("L").resize((size, size)).convert("RGB")
+    image = Image.merge("RGB", [b.point(lambda v, k=k: v * k // 4) for k, b in zip((1, 2, 3), image.split())])
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "_StubHTTPServer"
+
+    def log_message(self, *args):
+        pass
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        try:
+            return json.loads(body or b"{}")
+        except ValueError:
+            return {}
+
+    def _send(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_GET(self):
+        match = re.match(r"^/nager/PublicHolidays/(\d{4})/(\w+)$", self.path)
+        if not match:
+            self._send(404, b"not found", "text/plain")
+            return
+        self.server.wait("nager")
+        year = match.group(1)
+        holidays = [dict(item, date=item["date"].replace("{year}", year)) for item in self.server.holidays]
+        self._send(200, json.dumps(holidays).encode(), "application/json")
+
+    def do_POST(self):
+        payload = self._read_json()
+        if self.path == "/openrouter/chat/completions":
+            self._openrouter(payload)
+        elif self.path == "/huggingface":
+            self.server.wait("huggingface")
+            self._send(200, self.server.background, "image/png")
+        elif self.path == "/slack":
+            self.server.wait("slack")
+            self._send(200, b"ok", "text/plain")
+        elif self.path.startswith("/slackapi/"):
+            self._slack_api(self.path[len("/slackapi/"):])
+        elif self.path.startswith("/slackupload/"):
+            self.server.wait("slack")
+            self._send(200, b"OK - uploaded", "text/plain")
+        else:
+            self._send(404, b"not found", "text/plain")
+
+    def _slack_api(self, method: str):
+        self.server.wait("slack")
+        if method == "chat.postMessage":
+            body = {"ok": True, "ts": f"{time.time():.6f}"}
+        elif method == "files.getUploadURLExternal":
+            file_id = f"F{self.server.requests['slack']:08d}"
+            body = {"ok": True, "file_id": file_id, "upload_url": f"http://127.0.0.1:{self.server.server_port}/slackupload/{file_id}"}
+        elif method == "files.completeUploadExternal":
+            body = {"ok": True, "files": []}
+        else:
+            body = {"ok": False, "error": "unknown_method"}
+        self._send(200, json.dumps(body).encode(), "application/json")
+
+    def _openrouter(self, payload: Dict):
+        prompt = payload.get("messages", [{}])[-1].get("content", "")
+        if payload.get("stream"):
+            self._openrouter_stream()
+            return
+        self.server.wait("openrouter")
+        if payload.get("response_format", {}).get("type") == "json_object":
+            # Answer every id in the batch prompt, cycling through the recorded posts
+            ids = re.findall(r'- id "(\d+)"', prompt)
+            recorded = json.loads(self.server.batch_completion["choices"][0]["message"]["content"])["items"]
+            items = [{"id": i, "posts": recorded[n % len(recorded)]["posts"]} for n, i in enumerate(ids)]
+            response = copy.deepcopy(self.server.batch_completion)
+            response["choices"][0]["message"]["content"] = json.dumps({"items": items})
+        else:
+            response = self.server.chat_completion
+        self._send(200, json.dumps(response).encode(), "application/json")
+
+    def _openrouter_stream(self):
+        content = self.server.chat_completion["choices"][0]["message"]["content"]
+        chunks = [content[i:i + 12] for i in range(0, len(content), 12)]
+        latency = self.server.latency.get("openrouter", 0)
+        self.server.count("openrouter")
+        # Time to first token is about a third of the full completion
+        time.sleep(latency / 3)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            self._send_chunk(b": OPENROUTER PROCESSING\n\n")
+            for chunk in chunks:
+                time.sleep(latency * 2 / 3 / len(chunks))
+                event = {"choices": [{"index": 0, "delta": {"content": chunk}}]}
+                self._send_chunk(b"data: " + json.dumps(event).encode() + b"\n\n")
+            self._send_chunk(b"data: [DONE]\n\n")
+            self._send_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stops reading once it has all the posts it asked for
+            self.close_connection = True
+
+
+class _StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency: Dict[str, float]):
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.requests = Counter()
+        self._lock = threading.Lock()
+        self.chat_completion = load_fixture("openrouter_chat.json")
+        self.batch_completion = load_fixture("openrouter_batch.json")
+        self.holidays = load_fixture("nager_ae.json")
+        self.background = _background_png()
+
+    def count(self, service: str):
+        with self._lock:
+            self.requests[service] += 1
+
+    def wait(self, service: str):
+        self.count(service)
+        time.sleep(self.latency.get(service, 0))
+
+
+class StubServers:
+    """Local replay server for OpenRouter, HuggingFace, Nager.Date and Slack."""
+
+    def __init__(self, latency: Optional[Dict[str, float]] = None):
+        self.latency = dict(DEFAULT_LATENCY, **(latency or {}))
+        self._server: Optional[_StubHTTPServer] = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def start(self) -> "StubServers":
+        self._server = _StubHTTPServer(("127.0.0.1", 0), self.latency)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    @property
+    def requests(self) -> Counter:
+        return self._server.requests
+
+    def env(self) -> Dict[str, str]:
+        """Environment variables that point every integration at the stubs."""
+        return {
+            "OPENROUTER_API_KEY": "bench",
+            "OPENROUTER_API_BASE": f"{self.base_url}/openrouter",
+            "HUGGINGFACE_API_KEY": "bench",
+            "HUGGINGFACE_API_URL": f"{self.base_url}/huggingface",
+            "NAGER_API_BASE": f"{self.base_url}/nager",
+            "SLACK_WEBHOOK_URL": f"{self.base_url}/slack",
+            "SLACK_BOT_TOKEN": "bench",
+            "SLACK_CHANNEL_ID": "CBENCH",
+            "SLACK_API_BASE": f"{self.base_url}/slackapi",
+        }
+
+
+def fixture_gnews(latency: float = DEFAULT_LATENCY["gnews"]):
+    """A drop-in replacement for gnews.GNews that returns recorded results after `latency` seconds."""
+    results = load_fixture("gnews_results.json")
+
+    class FixtureGNews:
+        def __init__(self, language="en", country="US", max_results=100, **kwargs):
+            self.max_results = max_results
+            self.period = None
+
+        def get_news(self, key):
+            time.sleep(latency)
+            return copy.deepcopy(results[:self.max_results])
+
+    return FixtureGNews
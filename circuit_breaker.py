@@ -0,0 +1,183 @@
+"""Per-upstream circuit breakers, latency budgets and a per-request deadline.
+
+Each upstream (openrouter, huggingface, gnews, nager) has a breaker. A call that fails
+or takes longer than the upstream's latency budget counts as a failure; after
+CIRCUIT_FAILURE_THRESHOLD failures in a row the breaker opens and callers go straight
+to their fallback for CIRCUIT_COOLDOWN seconds. Then a single probe call is let
+through: success closes the breaker, failure opens it for another cool-down.
+
+`deadline(seconds)` bounds a whole generation request: every upstream timeout inside
+it (including http_client's) is capped by the time left, and once it is spent calls
+raise DeadlineExceeded instead of starting. Running out of our own deadline is not the
+upstream's fault, so it never counts against a breaker. The deadline lives in a
+contextvar, so it follows work handed to threads through `metrics.submit`.
+"""
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional
+
+from settings import get_settings
+
+_settings = get_settings()
+CIRCUIT_FAILURE_THRESHOLD = _settings.circuit_failure_threshold
+CIRCUIT_COOLDOWN = _settings.circuit_cooldown
+GENERATION_DEADLINE = _settings.generation_deadline
+# Seconds an upstream may take before the call counts as failed; also its request timeout
+LATENCY_BUDGETS = {
+    "openrouter": _settings.openrouter_budget,
+    "huggingface": _settings.huggingface_budget,
+    "gnews": _settings.gnews_budget,
+    "nager": _settings.nager_budget,
+}
+
+# Absolute time.monotonic() by which the current request must finish, or None
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("deadline", default=None)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling an upstream whose breaker is open."""
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request's overall deadline has passed."""
+
+
+@contextmanager
+def deadline(seconds: Optional[float] = GENERATION_DEADLINE) -> Iterator[None]:
+    """Give the enclosed work at most `seconds` (None or 0: no limit); nested deadlines only tighten."""
+    if not seconds:
+        yield
+        return
+    expires = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(expires if current is None else min(current, expires))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def time_left() -> Optional[float]:
+    """Seconds until the current deadline (may be negative), or None without one."""
+    expires = _deadline.get()
+    return None if expires is None else expires - time.monotonic()
+
+
+def cap_timeout(timeout: float) -> float:
+    """`timeout` shortened to the time left; raises DeadlineExceeded when none is left."""
+    left = time_left()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceeded("request deadline exceeded")
+    return min(timeout, left)
+
+
+def _is_timeout(error: BaseException) -> bool:
+    import requests
+
+    return isinstance(error, (TimeoutError, requests.Timeout))
+
+
+def is_upstream_error(response) -> bool:
+    """Responses that say the upstream is unhealthy, as opposed to a bad request or key."""
+    return response.status_code == 429 or response.status_code >= 500
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker for one upstream; thread-safe, state kept in memory."""
+
+    def __init__(self, name: str, latency_budget: float, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 cooldown: float = CIRCUIT_COOLDOWN):
+        self.name = name
+        self.latency_budget = latency_budget
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self._state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """"closed", "open" or "half_open" (a probe call is in flight)."""
+        with self._lock:
+            return self._state
+
+    def is_open(self) -> bool:
+        """Whether a call now would be refused; unlike `allow`, never claims the probe."""
+        with self._lock:
+            if self._state == "open":
+                return time.monotonic() - self._opened_at < self.cooldown
+            return self._state == "half_open"
+
+    def allow(self) -> bool:
+        """Whether to call the upstream now. After the cool-down, exactly one caller gets True as the probe."""
+        with self._lock:
+            if self._state == "closed":
+                return True
+            if self._state == "open" and time.monotonic() - self._opened_at >= self.cooldown:
+                self._state = "half_open"
+                return True
+            return False
+
+    def record(self, ok: bool, elapsed: float = 0.0):
+        """Report the outcome of an allowed call; calls over the latency budget count as failures."""
+        ok = ok and elapsed <= self.latency_budget
+        with self._lock:
+            if ok:
+                if self._state != "closed":
+                    print(f"Circuit {self.name} closed")
+                self._state = "closed"
+                self._failures = 0
+                return
+            self._failures += 1
+            if self._state == "half_open" or self._failures >= self.failure_threshold:
+                if self._state != "open":
+                    print(f"Circuit {self.name} open for {self.cooldown:.0f}s after {self._failures} failures")
+                self._state = "open"
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        """Give back an allowed call whose outcome says nothing about the upstream."""
+        with self._lock:
+            if self._state == "half_open":
+                # The cool-down has already passed, so the next caller probes again
+                self._state = "open"
+
+    def timeout(self) -> float:
+        """The upstream's latency budget, capped by the request deadline."""
+        return cap_timeout(self.latency_budget)
+
+    def call(self, fn: Callable[..., Any], *args, failed: Optional[Callable[[Any], bool]] = None, **kwargs) -> Any:
+        """Run `fn` through the breaker.
+
+        Raises CircuitOpenError without calling `fn` while the breaker is open. Exceptions,
+        results for which `failed(result)` is true and slow calls are recorded as failures,
+        except DeadlineExceeded and timeouts the request deadline cut below the budget.
+        """
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} is unavailable (circuit open)")
+        left = time_left()
+        # The caller's deadline, not the upstream, sets the timeout for this call
+        capped = left is not None and left < self.latency_budget
+        started = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            if isinstance(e, DeadlineExceeded) or (capped and _is_timeout(e)):
+                self.release()
+            else:
+                self.record(False)
+            raise
+        self.record(not (failed and failed(result)), time.monotonic() - started)
+        return result
+
+
+@functools.lru_cache(maxsize=None)
+def breaker(name: str) -> CircuitBreaker:
+    """Process-wide breaker for an upstream named in LATENCY_BUDGETS."""
+    return CircuitBreaker(name, LATENCY_BUDGETS[name])
@@ -1,92 +1,128 @@
-import os
-from dotenv import load_dotenv
-load_dotenv()
-from gnews import GNews
 import datetime
-import requests
-from typing import Dict, Optional
+import functools
+import json
+import random
+import re
+import threading
+import time
+import http_client
+import metrics
+from typing import Dict, Iterator, List, Optional, Sequence, Union
+from circuit_breaker import breaker, is_upstream_error, time_left
+from disk_cache import DiskCache
+from holiday_store import HolidayStore
+from post_history import post_history
+from settings import get_settings
 
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-OPENROUTER_API_BASE = "https://openrouter.ai/api/v1"
-OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL", "mistralai/mixtral-8x7b-instruct")  # Default to a good free model
+_settings = get_settings()
+OPENROUTER_API_KEY = _settings.openrouter_api_key
+OPENROUTER_API_BASE = _settings.openrouter_api_base
+OPENROUTER_MODEL = _settings.openrouter_model
 
-_UAE_HOLIDAY_CACHE: Dict[int, Dict[str, str]] = {}
+LEGAL_NICHES = ["Corporate Law", "Family Law", "Criminal Law", "Intellectual Property", "Immigration Law", "Real Estate Law", "Tax Law"]
 
+# Max (niche, date) items combined into one structured OpenRouter request
+LLM_BATCH_SIZE = _settings.llm_batch_size
+# Lines containing these leak the hidden context and are dropped from the output
+_LEAKED_CONTEXT_MARKERS = ["trending topic", "headline", "news article"]
+_LIST_MARKER = re.compile(r'^\d+[.)]\s*')
 
-def _fetch_uae_public_holidays_from_api(year: int) -> Dict[str, str]:
-    """Fetch UAE public holidays for a given year using the Nager.Date public API.
+# Trending-news cache: a (niche, date) headline rarely changes within an hour
+NEWS_CACHE_TTL = _settings.news_cache_ttl
+NEWS_CACHE_MAX_ENTRIES = _settings.news_cache_max_entries
 
-    API: GET https://date.nager.at/api/v3/PublicHolidays/{year}/AE
-    Returns mapping YYYY-MM-DD -> holiday name. Empty dict on failure.
-    """
-    try:
-        url = f"https://date.nager.at/api/v3/PublicHolidays/{year}/AE"
-        resp = requests.get(url, timeout=10)
-        if resp.status_code != 200:
-            return {}
-        data = resp.json()
-        results: Dict[str, str] = {}
-        for item in data:
-            date_str = item.get("date")  # e.g., "2025-12-02"
-            name = item.get("localName") or item.get("name")
-            if date_str and name:
-                results[date_str] = name
-        return results
-    except Exception:
-        return {}
+# Extra posts requested per call, so a rejected repeat rarely costs a second request
+POST_DEDUP_EXTRA = _settings.post_dedup_extra
+POST_DEDUP_ATTEMPTS = 2
+
+
+@functools.lru_cache(maxsize=None)
+def uae_holiday_store() -> HolidayStore:
+    """Process-wide UAE holiday calendar, persisted under CACHE_DIR."""
+    return HolidayStore("AE")
 
 
 def _uae_public_holidays_for_year(year: int) -> Dict[str, str]:
     """Return a mapping of YYYY-MM-DD -> holiday name for UAE for a given year.
 
-    Tries dynamic lookup via Nager.Date; falls back to a minimal fixed set if the API fails.
+    Served from the persistent holiday store; falls back to a minimal fixed set while the API is failing.
     """
-    if year in _UAE_HOLIDAY_CACHE:
-        return _UAE_HOLIDAY_CACHE[year]
-
-    api_map = _fetch_uae_public_holidays_from_api(year)
-    if api_map:
-        _UAE_HOLIDAY_CACHE[year] = api_map
-        return api_map
-
-    # Fallback minimal set (only a few fixed-date holidays)
-    fallback = {
-        f"{year}-01-01": "New Year's Day",
-        f"{year}-12-01": "Commemoration Day",
-        f"{year}-12-02": "UAE National Day (Day 1)",
-        f"{year}-12-03": "UAE National Day (Day 2)",
-    }
-    _UAE_HOLIDAY_CACHE[year] = fallback
-    return fallback
+    return uae_holiday_store().year_map(year)
 
 
 def get_today_uae_holiday_name(today: Optional[datetime.date] = None) -> Optional[str]:
     """Return the UAE holiday name for today if it is a public holiday, else None."""
     if today is None:
         today = datetime.date.today()
-    year_map = _uae_public_holidays_for_year(today.year)
-    return year_map.get(today.isoformat())
+    return uae_holiday_store().holiday_name(today)
+
+
+def get_uae_holidays_between(start: datetime.date, end: datetime.date) -> Dict[datetime.date, str]:
+    """Return {date: holiday name} for every UAE public holiday from `start` to `end` inclusive."""
+    return uae_holiday_store().holidays_between(start, end)
+
+
+@functools.lru_cache(maxsize=None)
+def _news_cache() -> DiskCache:
+    return DiskCache("trending_news", ttl=NEWS_CACHE_TTL, max_entries=NEWS_CACHE_MAX_ENTRIES)
 
 
+def news_cache_stats() -> Dict[str, int]:
+    """Hit/miss counters for the trending-news cache, useful for tuning NEWS_CACHE_TTL."""
+    return _news_cache().stats()
+
+
+@metrics.instrument("trending_news")
 def fetch_trending_article(niche: str, target_date: Optional[datetime.date]) -> Dict[str, Optional[str]]:
     """Fetch a single trending article for the given niche and date, preferring UAE sources.
 
     Returns a dict with keys: 'title', 'url', 'published', 'publisher'.
-    Falls back to generic niche label if nothing found.
+    Falls back to generic niche label if nothing found. Results are served from an
+    on-disk cache keyed by niche, date and query; stale entries are refreshed in the background.
+    While the news circuit is open, any cached headline for the key is served, however old.
     """
     # Prefer UAE-relevant content
     query = f"{niche} law UAE"
+    key = f"{niche}|{target_date.isoformat() if target_date else ''}|{query}"
+    if breaker("gnews").is_open():
+        cached = _news_cache().get(key)
+        if cached is not None:
+            metrics.annotate(cache_hit=True, fallback=True, reason="circuit open")
+            return cached[0]
+    article, hit = _news_cache().get_or_load(
+        key,
+        lambda: _fetch_trending_article_uncached(niche, target_date, query),
+        # Don't pin the generic fallback headline when the scrape came back empty
+        should_cache=lambda article: bool(article.get('url')),
+    )
+    metrics.annotate(cache_hit=hit, fallback=not article.get('url'))
+    return article
+
+
+@functools.lru_cache(maxsize=None)
+def _gnews_client(period: Optional[str] = None):
+    """One GNews client per search period; gnews and its scraping stack load on first use."""
+    from gnews import GNews
+
+    client = GNews(language='en', country='AE', max_results=10)
+    if period:
+        client.period = period
+    return client
 
+
+def _fetch_trending_article_uncached(niche: str, target_date: Optional[datetime.date], query: str) -> Dict[str, Optional[str]]:
     use_period = None
     if target_date and target_date == datetime.date.today():
         use_period = '1d'
 
-    gnews = GNews(language='en', country='AE', max_results=10)
-    if use_period:
-        gnews.period = use_period
-
+    gnews = breaker("gnews")
+    left = time_left()
     try:
-        results = gnews.get_news(query)
+        # GNews takes no timeout, so a slow scrape counts against the breaker after the fact
+        if left is not None and left <= 0:
+            results = []
+        else:
+            results = gnews.call(_gnews_client(use_period).get_news, query)
     except Exception:
         results = []
 
@@ -117,10 +153,12 @@ def fetch_trending_article(niche: str, target_date: Optional[datetime.date]) ->
         'publisher': None,
     }
 
+@metrics.instrument("firm_context")
 def get_firm_context(niche, date_override: Optional[datetime.date] = None):
     trending_article = fetch_trending_article(niche, date_override or datetime.date.today())
     today_date = date_override or datetime.date.today()
     holiday_name = get_today_uae_holiday_name(today_date)
+    metrics.annotate(niche=niche, is_holiday=bool(holiday_name))
     return {
         "firm_name": "Al-Adl Legal",
         "location": "Dubai",
@@ -136,9 +174,34 @@ def get_firm_context(niche, date_override: Optional[datetime.date] = None):
     }
 #     )
 
-def build_prompt(context, num_posts=2):
+
+class RequestContext:
+    """Firm context for a single generation run, resolved once and shared.
+
+    The first call to `resolve()` performs the news and holiday lookups; every later
+    call (text generation, image prompting, the Slack message) gets the same dict, so
+    the headline shown to the user is the one the LLM saw.
+    """
+
+    def __init__(self, niche, date_override: Optional[datetime.date] = None):
+        self.niche = niche
+        self.date_override = date_override
+        self._context: Optional[Dict] = None
+        self._lock = threading.Lock()
+
+    def resolve(self) -> Dict:
+        if self._context is None:
+            with self._lock:
+                if self._context is None:
+                    self._context = get_firm_context(self.niche, date_override=self.date_override)
+        return self._context
+
+def build_prompt(context, num_posts=2, avoid: Sequence[str] = ()):
     import random, time
     randomizer = f"Seed: {random.randint(1000,9999)} Time: {int(time.time())}"
+    if avoid:
+        # Earlier posts for this niche; the history index still rejects anything that slips through
+        randomizer += "\nDo not repeat or closely paraphrase any of these earlier posts:\n" + "\n".join(f"- {post}" for post in avoid)
     if context.get("is_holiday"):
         holiday_name = context.get("holiday_name", "UAE Public Holiday")
         return (
@@ -178,13 +241,91 @@ def build_prompt(context, num_posts=2):
             f"Format output as a numbered list, each post separated by a blank line."
         )
 
-def get_post_ideas(niche, num_posts=3, date_override: Optional[datetime.date] = None):
-    if not OPENROUTER_API_KEY:
-        return {"error": "OPENROUTER_API_KEY is not set in the .env"}
+def build_batch_prompt(contexts: List[Dict], num_posts=2):
+    """Prompt asking for posts for several (niche, date) items in one structured JSON response.
+
+    The firm details and writing rules are stated once; each item only adds its niche,
+    date and either its holiday or its hidden trending topic.
+    """
+    first = contexts[0]
+    item_lines = []
+    for i, context in enumerate(contexts):
+        if context.get("is_holiday"):
+            theme = f"UAE public holiday: {context.get('holiday_name', 'UAE Public Holiday')} (theme every post around it, respectfully)"
+        else:
+            theme = f"Trending topic (hidden context, never mention it directly): {context['trending']}"
+        item_lines.append(f'- id "{i}": Niche: {context["niche"]}. Date: {context["date"]}. {theme}')
+    items = "\n".join(item_lines)
+    return (
+        f"You are a social media copywriter for a law firm in Dubai.\n"
+        f"Firm: {first['firm_name']} (Located in {first['location']}, {first['country']})\n"
+        f"Seed: {random.randint(1000,9999)} Time: {int(time.time())}\n"
+        f"For EACH item below, create {num_posts} short, punchy Instagram post ideas as a question or bold statement (not a headline or news summary).\n"
+        f"{items}\n"
+        f"Rules: one sentence per post, 10–16 words, no hashtags, no emojis, no quotes, no author names, no firm name, no promotion. "
+        f"Prefer engaging questions that spark participation. Tone must be respectful and appropriate for the UAE. "
+        f"Do NOT mention the trending topic, news headline, or any context in your output. "
+        f"Every post must be completely different from all others—do not repeat ideas, wording, or structure. "
+        f"Make each post suitable for direct overlay on a graphic, as a bold statement or fact, not a caption.\n"
+        f'Respond with JSON only, no prose: {{"items": [{{"id": "0", "posts": ["...", "..."]}}, ...]}} '
+        f"with exactly {num_posts} posts per item and one entry for every id."
+    )
+
+
+def _is_valid_post(text) -> bool:
+    return isinstance(text, str) and len(text.strip()) > 10 and not any(x in text.lower() for x in _LEAKED_CONTEXT_MARKERS)
+
+
+def _clean_post_line(line: str) -> str:
+    """Strip list markers ("-", "1.", "2)") from one line of model output."""
+    return _LIST_MARKER.sub("", line.strip("- ").strip()).strip()
 
-    context = get_firm_context(niche, date_override=date_override)
-    prompt = build_prompt(context, num_posts=num_posts)
 
+def _parse_posts(content: str, num_posts: int) -> List[str]:
+    """Split a numbered-list completion into individual posts."""
+    posts = []
+    for line in content.split('\n'):
+        line = _clean_post_line(line)
+        if line and _is_valid_post(line):
+            posts.append(line)
+    if len(posts) < num_posts:
+        posts = re.split(r'\d+\. ', content)
+        posts = [p.strip() for p in posts if p.strip() and _is_valid_post(p)]
+    return posts[:num_posts]
+
+
+def _parse_batch_posts(content: str, count: int, num_posts: int) -> List[Optional[List[str]]]:
+    """Extract per-item posts from a batch JSON completion; None marks an item that failed validation."""
+    results: List[Optional[List[str]]] = [None] * count
+    # Models sometimes wrap JSON in code fences or add a sentence around it
+    start, end = content.find("{"), content.rfind("}")
+    if start == -1 or end <= start:
+        return results
+    try:
+        items = json.loads(content[start:end + 1]).get("items")
+    except (ValueError, AttributeError):
+        return results
+    if not isinstance(items, list):
+        return results
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        try:
+            index = int(item.get("id"))
+        except (TypeError, ValueError):
+            continue
+        posts = item.get("posts")
+        if not 0 <= index < count or not isinstance(posts, list):
+            continue
+        posts = [p.strip() for p in posts if _is_valid_post(p)]
+        if len(posts) >= num_posts:
+            results[index] = posts
+    return results
+
+
+@metrics.instrument("openrouter_chat")
+def _openrouter_chat(prompt: str, max_tokens: int = 512, temperature: float = 1.2, json_mode: bool = False) -> str:
+    """Send one chat completion to OpenRouter and return the message content; raises on API errors."""
     headers = {
         "Authorization": f"Bearer {OPENROUTER_API_KEY}",
         "Content-Type": "application/json"
@@ -195,26 +336,230 @@ def get_post_ideas(niche, num_posts=3, date_override: Optional[datetime.date] =
             {"role": "system", "content": "You are a helpful assistant."},
             {"role": "user", "content": prompt}
         ],
-        "max_tokens": 512,
-        "temperature": 1.2
+        "max_tokens": max_tokens,
+        "temperature": temperature
     }
+    if json_mode:
+        data["response_format"] = {"type": "json_object"}
+    openrouter = breaker("openrouter")
+    response = openrouter.call(http_client.post, f"{OPENROUTER_API_BASE}/chat/completions", headers=headers, json=data,
+                               timeout=openrouter.timeout(), failed=is_upstream_error)
+    metrics.annotate(model=OPENROUTER_MODEL, status_code=response.status_code,
+                     request_bytes=len(json.dumps(data).encode()), response_bytes=len(response.content))
+    if response.status_code != 200:
+        raise RuntimeError(f"OpenRouter API error: {response.status_code} {response.text}")
+    result = response.json()
+    return result["choices"][0]["message"]["content"]
+
+
+def _openrouter_stream(prompt: str, max_tokens: int = 512, temperature: float = 1.2) -> Iterator[str]:
+    """Stream a chat completion from OpenRouter over SSE, yielding content deltas as they arrive."""
+    headers = {
+        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    data = {
+        "model": OPENROUTER_MODEL,
+        "messages": [
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": prompt}
+        ],
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "stream": True
+    }
+    openrouter = breaker("openrouter")
+    # Covers the time to first byte; the budget then bounds each gap between chunks
+    response = openrouter.call(http_client.post, f"{OPENROUTER_API_BASE}/chat/completions", headers=headers, json=data,
+                               timeout=openrouter.timeout(), stream=True, failed=is_upstream_error)
     try:
-        response = requests.post(f"{OPENROUTER_API_BASE}/chat/completions", headers=headers, json=data, timeout=30)
         if response.status_code != 200:
-            return {"error": f"OpenRouter API error: {response.status_code} {response.text}"}
-        result = response.json()
-        content = result["choices"][0]["message"]["content"]
-        # Split output into posts
-        posts = []
-        for line in content.split('\n'):
-            line = line.strip("- ").strip()
-            if line and len(line) > 10 and not any(x in line.lower() for x in ["trending topic", "headline", "news article"]):
-                posts.append(line)
-        if len(posts) < num_posts:
-            import re
-            posts = re.split(r'\d+\. ', content)
-            posts = [p.strip() for p in posts if p.strip() and len(p.strip()) > 10 and not any(x in p.lower() for x in ["trending topic", "headline", "news article"])]
-        return posts[:num_posts]
+            raise RuntimeError(f"OpenRouter API error: {response.status_code} {response.text}")
+        for raw in response.iter_lines():
+            line = raw.decode("utf-8", errors="replace").strip()
+            # Blank lines separate events; lines starting with ":" are keep-alive comments
+            if not line.startswith("data:"):
+                continue
+            payload = line[len("data:"):].strip()
+            if payload == "[DONE]":
+                break
+            chunk = json.loads(payload)
+            if chunk.get("error"):
+                raise RuntimeError(f"OpenRouter API error: {chunk['error'].get('message', chunk['error'])}")
+            choices = chunk.get("choices") or [{}]
+            delta = (choices[0].get("delta") or {}).get("content")
+            if delta:
+                yield delta
+    finally:
+        response.close()
+
+
+def stream_post_ideas(niche, num_posts=3, date_override: Optional[datetime.date] = None, context: Optional[Dict] = None) -> Iterator[str]:
+    """Yield post ideas one at a time as the streamed completion finishes each line.
+
+    Same prompt and filtering as `get_post_ideas`, but the first post is available as
+    soon as its line is complete. Raises RuntimeError on API errors.
+    """
+    stage = metrics.start_span("post_ideas_stream", niche=niche)
+    count = 0
+    error = None
+    try:
+        for post in _stream_post_ideas(niche, num_posts, date_override, context):
+            count += 1
+            if count == 1:
+                stage.set(first_post_ms=round(stage.elapsed() * 1000, 1))
+            yield post
     except Exception as e:
-        return {"error": f"OpenRouter API error: {str(e)}"}
+        error = e
+        raise
+    finally:
+        # Set before finishing: the span is recorded by finish(), failed or not
+        stage.set(posts=count)
+        stage.finish(error)
+
+
+def _stream_post_ideas(niche, num_posts, date_override: Optional[datetime.date], context: Optional[Dict]) -> Iterator[str]:
+    if not OPENROUTER_API_KEY:
+        raise RuntimeError("OPENROUTER_API_KEY is not set in the .env")
+
+    if context is None:
+        context = get_firm_context(niche, date_override=date_override)
+    history = post_history()
+    emitted: List[str] = []
+
+    def _accept(post: str) -> bool:
+        # The fallback parse below re-reads the whole completion, so exact repeats of streamed lines
+        # must be skipped here; the similarity check is off when POST_DEDUP_THRESHOLD is 0
+        if len(emitted) >= num_posts or post in emitted or not history.filter_new([post], accepted=emitted):
+            return False
+        emitted.append(post)
+        history.add([post], niche=context["niche"], day=context["date"])
+        return True
+
+    prompt = build_prompt(context, num_posts=num_posts + POST_DEDUP_EXTRA, avoid=history.recent(context["niche"]))
+    content = ""
+    pending = ""
+    for delta in _openrouter_stream(prompt, max_tokens=512):
+        content += delta
+        pending += delta
+        *complete, pending = pending.split("\n")
+        for line in complete:
+            line = _clean_post_line(line)
+            if line and _is_valid_post(line) and _accept(line):
+                yield line
+                if len(emitted) >= num_posts:
+                    return
+    line = _clean_post_line(pending)
+    if line and _is_valid_post(line) and _accept(line):
+        yield line
+    if len(emitted) < num_posts:
+        # Model ignored the one-post-per-line format; recover the rest like get_post_ideas does
+        for post in _parse_posts(content, num_posts + POST_DEDUP_EXTRA):
+            if _accept(post):
+                yield post
+    if len(emitted) < num_posts:
+        # Too many repeats of earlier posts: top up with a regular request
+        try:
+            extra = _generate_unique_posts(context, num_posts - len(emitted), accepted=emitted)
+        except Exception as e:
+            print(f"Could not top up streamed posts: {e}")
+            return
+        for post in extra:
+            if _accept(post):
+                yield post
+
+
+def _generate_unique_posts(context: Dict, num_posts: int, accepted: Sequence[str] = ()) -> List[str]:
+    """Request a few more posts than needed and keep those that don't repeat the post history.
+
+    Asks again (at most POST_DEDUP_ATTEMPTS times) if too many were repeats, telling the
+    model which ones to avoid. May return fewer than `num_posts`; raises on API errors.
+    Accepted posts are not recorded; callers add them to the history once they are used.
+    """
+    history = post_history()
+    avoid = history.recent(context["niche"]) + list(accepted)
+    posts: List[str] = []
+    duplicates = 0
+    for _ in range(POST_DEDUP_ATTEMPTS):
+        asked = num_posts - len(posts) + POST_DEDUP_EXTRA
+        content = _openrouter_chat(build_prompt(context, num_posts=asked, avoid=avoid), max_tokens=512)
+        candidates = _parse_posts(content, asked)
+        fresh = history.filter_new(candidates, accepted=list(accepted) + posts)
+        duplicates += len(candidates) - len(fresh)
+        posts.extend(fresh[:num_posts - len(posts)])
+        if len(posts) >= num_posts:
+            break
+        avoid += [post for post in candidates if post not in fresh]
+    metrics.annotate(duplicates_rejected=duplicates)
+    return posts
+
+
+@metrics.instrument("post_ideas")
+def get_post_ideas(niche, num_posts=3, date_override: Optional[datetime.date] = None, context: Optional[Dict] = None):
+    """Generate post ideas for a niche.
+
+    Pass a prebuilt `context` (e.g. from `RequestContext.resolve()`) to reuse the
+    news and holiday lookups already made for this run instead of fetching them again.
+    Posts that repeat an earlier post (see `post_history`) are dropped and replaced;
+    the returned posts are recorded in the history.
+    """
+    if not OPENROUTER_API_KEY:
+        metrics.fail("OPENROUTER_API_KEY is not set")
+        return {"error": "OPENROUTER_API_KEY is not set in the .env"}
+
+    if context is None:
+        context = get_firm_context(niche, date_override=date_override)
+    try:
+        posts = _generate_unique_posts(context, num_posts)
+        metrics.annotate(niche=niche, posts=len(posts))
+        if not posts:
+            metrics.fail("every generated post repeated an earlier one")
+            return {"error": "Every generated post repeated an earlier one; please try again."}
+        post_history().add(posts, niche=context["niche"], day=context["date"])
+        return posts
+    except Exception as e:
+        message = str(e)
+        if not message.startswith("OpenRouter API error"):
+            message = f"OpenRouter API error: {message}"
+        metrics.fail(message)
+        return {"error": message}
+
+
+def get_post_ideas_batch(contexts: List[Dict], num_posts=2, batch_size: int = LLM_BATCH_SIZE) -> List[Union[List[str], Dict[str, str]]]:
+    """Generate posts for several prebuilt contexts with one structured request per `batch_size` items.
+
+    Returns one entry per context, in order: a list of posts, or an {"error": ...}
+    dict like `get_post_ideas`. Items missing from or invalid in the JSON response,
+    or whose posts repeat the post history, are retried individually with `get_post_ideas`.
+    """
+    if not OPENROUTER_API_KEY:
+        return [{"error": "OPENROUTER_API_KEY is not set in the .env"} for _ in contexts]
 
+    results: List[Union[List[str], Dict[str, str], None]] = []
+    for start in range(0, len(contexts), max(1, batch_size)):
+        chunk = contexts[start:start + max(1, batch_size)]
+        if len(chunk) == 1:
+            results.append(None)
+            continue
+        asked = num_posts + POST_DEDUP_EXTRA
+        prompt = build_batch_prompt(chunk, num_posts=asked)
+        # Roughly 40 tokens per post plus JSON framing
+        max_tokens = min(4096, 64 + len(chunk) * asked * 48)
+        try:
+            content = _openrouter_chat(prompt, max_tokens=max_tokens, temperature=1.0, json_mode=True)
+            results.extend(_parse_batch_posts(content, len(chunk), num_posts))
+        except Exception as e:
+            print(f"Batch post generation failed, falling back to per-item requests: {e}")
+            results.extend([None] * len(chunk))
+    history = post_history()
+    for i, posts in enumerate(results):
+        if posts is not None:
+            # Items are recorded as they are accepted, so later items can't repeat earlier ones either
+            fresh = history.filter_new(posts)
+            if len(fresh) >= num_posts:
+                results[i] = fresh[:num_posts]
+                history.add(results[i], niche=contexts[i]["niche"], day=contexts[i]["date"])
+                continue
+        # Missing, invalid or mostly repeats: retry on its own
+        results[i] = get_post_ideas(contexts[i]["niche"], num_posts=num_posts, context=contexts[i])
+    return results
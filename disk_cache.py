@@ -0,0 +1,142 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from settings import get_settings
+
+CACHE_DIR = get_settings().cache_dir
+# Seconds a connection waits for another writer before raising "database is locked"
+SQLITE_TIMEOUT = 5
+
+
+def open_sqlite(path: str, row_factory=None) -> sqlite3.Connection:
+    """Connection to the SQLite file at `path`, in WAL mode so readers don't block the writer."""
+    conn = sqlite3.connect(path, timeout=SQLITE_TIMEOUT)
+    if row_factory is not None:
+        conn.row_factory = row_factory
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+@contextmanager
+def connect_sqlite(path: str, row_factory=None) -> Iterator[sqlite3.Connection]:
+    """Short-lived connection for one transaction: committed on success, rolled back on error, always closed."""
+    conn = open_sqlite(path, row_factory)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+class DiskCache:
+    """Persistent key/value cache with a TTL, LRU eviction and stale-while-revalidate.
+
+    Entries live in a SQLite file under CACHE_DIR, so they survive restarts and are
+    shared between Streamlit sessions and processes. Values must be JSON-serialisable.
+    An entry younger than `ttl` is fresh; up to `stale_ttl` seconds past that it is
+    still served, while a single background refresh replaces it.
+    """
+
+    def __init__(self, name: str, ttl: float, max_entries: int = 1024, stale_ttl: Optional[float] = None, directory: Optional[str] = None):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = ttl if stale_ttl is None else stale_ttl
+        self.max_entries = max_entries
+        directory = directory or CACHE_DIR
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{name}.sqlite3")
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "evictions": 0}
+        with connect_sqlite(self.path) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+
+    def _count(self, stat: str, n: int = 1):
+        with self._lock:
+            self._stats[stat] += n
+
+    def get(self, key: str):
+        """Return (value, age_seconds) for a stored entry, or None. Expiry is not checked."""
+        now = time.time()
+        with connect_sqlite(self.path) as conn:
+            row = conn.execute("SELECT value, stored_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(row[0]), now - row[1]
+
+    def set(self, key: str, value: Any):
+        now = time.time()
+        with connect_sqlite(self.path) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, stored_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            overflow = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                conn.execute(
+                    "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY accessed_at LIMIT ?)",
+                    (overflow,),
+                )
+                self._count("evictions", overflow)
+
+    def delete(self, key: str):
+        with connect_sqlite(self.path) as conn:
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def _refresh(self, key: str, loader: Callable[[], Any], should_cache: Optional[Callable[[Any], bool]]):
+        try:
+            value = loader()
+            if should_cache is None or should_cache(value):
+                self.set(key, value)
+        except Exception as e:
+            print(f"Cache refresh failed for {self.name}:{key}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get_or_load(self, key: str, loader: Callable[[], Any], should_cache: Optional[Callable[[Any], bool]] = None) -> Tuple[Any, bool]:
+        """Return (value, hit) for `key`, calling `loader` on a miss; `hit` is True for fresh and stale hits.
+
+        Stale entries are returned immediately and refreshed in a background thread;
+        only one refresh per key runs at a time. `should_cache` can reject values
+        (e.g. fallbacks) that should not be stored.
+        """
+        cached = self.get(key)
+        if cached is not None:
+            value, age = cached
+            if age < self.ttl:
+                self._count("hits")
+                return value, True
+            if age < self.ttl + self.stale_ttl:
+                self._count("stale_hits")
+                with self._lock:
+                    start = key not in self._refreshing
+                    if start:
+                        self._refreshing.add(key)
+                        self._stats["refreshes"] += 1
+                if start:
+                    threading.Thread(target=self._refresh, args=(key, loader, should_cache), daemon=True).start()
+                return value, True
+        self._count("misses")
+        value = loader()
+        if should_cache is None or should_cache(value):
+            self.set(key, value)
+        return value, False
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters for this process plus the number of stored entries."""
+        with self._lock:
+            stats = dict(self._stats)
+        with connect_sqlite(self.path) as conn:
+            stats["entries"] = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return stats
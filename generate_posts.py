@@ -1,71 +1,191 @@
+import datetime
 import streamlit as st
-from content_api import get_post_ideas , get_firm_context
-from send_to_slack import send_post_to_slack
-from huggingface_api import generate_image_from_context
-from img_overlay import write_text_on_image
+from content_api import LEGAL_NICHES, uae_holiday_store
+from job_queue import job_queue
+from metrics import start_metrics_server
+# The image pipeline (PIL) is imported by the first job and the Slack outbox by _start_services, so neither
+# is on the import path of the script itself
 # from predis_api import generate_predis_image
-import os
-import tempfile
+
+DOWNLOAD_TARGETS = {"square": "Feed", "portrait": "Portrait", "story": "Story"}
+# Seconds between progress checks while following a job
+JOB_POLL_INTERVAL = 0.5
+
+
+def _show_headline(context):
+    # Show trending headline (non-holiday) once above the posts
+    if not context.get("is_holiday"):
+        headline = context.get("trending")
+        headline_url = context.get("trending_url")
+        st.markdown("**Today's trending topic:**")
+        if headline_url:
+            st.markdown(f"- [{headline}]({headline_url})")
+        else:
+            st.markdown(f"- {headline}")
+
+
+def _show_post(slot, i, niche, post, image=None, error=None):
+    """Render one post; `image` is the {target: ExportedImage} dict from the export stage."""
+    file_stem = f"post_{i+1}_{niche.replace(' ', '_').lower()}"
+    with slot.container():
+        st.markdown(f"### Post {i+1}")
+        if error is not None:
+            st.warning(f"Image generation failed for post {i+1}: {error}")
+        elif image:
+            st.image(image["preview"].data, caption=f"Post idea for {niche}")
+            columns = st.columns(len(DOWNLOAD_TARGETS))
+            for column, (target, label) in zip(columns, DOWNLOAD_TARGETS.items()):
+                export = image[target]
+                column.download_button(
+                    label=f"{label} ({export.size[0]}×{export.size[1]})",
+                    data=export.data,
+                    file_name=f"{file_stem}_{target}.{export.format.lower().replace('jpeg', 'jpg')}",
+                    mime=export.mime,
+                    key=f"download_{i}_{target}",
+                )
+        st.write(post)
+
+
+def _show_pending(slot, i, post):
+    with slot.container():
+        st.markdown(f"### Post {i+1}")
+        st.write(post)
+        st.caption("Rendering image...")
+
+
+def _show_timings(run):
+    """Per-stage timing panel for one click: where the wall time went, cache hits and fallbacks."""
+    with st.expander(f"Timings: {run.wall_time:.1f}s total", expanded=True):
+        rows = run.summary()
+        if rows:
+            st.table(rows)
+        else:
+            st.caption("No instrumented stages ran.")
+
+
+@st.fragment(run_every=3)
+def _show_deliveries():
+    """Status of this session's Slack deliveries, read from the outbox and refreshed in place."""
+    from slack_outbox import slack_outbox
+
+    outbox = slack_outbox()
+    for delivery_id in reversed(st.session_state.get("slack_deliveries", [])[-5:]):
+        delivery = outbox.status(delivery_id)
+        if delivery is None:
+            continue
+        label = f"{delivery['niche']} posts for {delivery['day']}"
+        if delivery["status"] == "sent":
+            st.success(f"{label}: sent to Slack.")
+        elif delivery["status"] == "failed":
+            st.error(f"{label}: Slack delivery failed: {delivery['last_error']}")
+        elif delivery["last_error"]:
+            st.warning(f"{label}: retrying Slack delivery (attempt {delivery['attempts']}): {delivery['last_error']}")
+        else:
+            st.info(f"{label}: queued for Slack.")
+
+
+@st.cache_resource
+def _start_services():
+    """Once per server process, not on every rerun: warm holidays in the background, serve /metrics
+    and start the Slack sender so deliveries queued before a restart go out."""
+    from slack_outbox import slack_outbox
+
+    uae_holiday_store().warm()
+    # Serves /metrics when METRICS_PORT is set
+    start_metrics_server()
+    slack_outbox().start_sender()
+
+
+def _follow_job(job, show_timings=False):
+    """Render a job's progress as it arrives until it finishes.
+
+    The job runs in the shared worker pool, so a rerun that interrupts this loop loses
+    nothing: the next run picks the job up again and shows everything it has so far.
+    """
+    queue = job_queue()
+    status = st.empty()
+    header = st.empty()
+    slots, shown = [], {}
+    while True:
+        snapshot = job.snapshot()
+        if snapshot["status"] == "queued":
+            ahead = queue.position(job)
+            status.info(f"{snapshot['stage']} ({ahead} ahead)..." if ahead else f"{snapshot['stage']}...")
+        elif snapshot["status"] == "running":
+            status.info(f"{snapshot['stage']}...")
+        else:
+            status.empty()
+        if snapshot["context"] and "headline" not in shown:
+            with header.container():
+                _show_headline(snapshot["context"])
+            shown["headline"] = True
+        for i, post in enumerate(snapshot["posts"]):
+            if i == len(slots):
+                # One placeholder per post keeps the display order stable while images finish out of order
+                slots.append(st.empty())
+            finished = i in snapshot["images"] or i in snapshot["image_errors"] or snapshot["status"] != "running"
+            if finished and shown.get(i) != "final":
+                _show_post(slots[i], i, job.niche, post, snapshot["images"].get(i), snapshot["image_errors"].get(i))
+                shown[i] = "final"
+            elif i not in shown:
+                _show_pending(slots[i], i, post)
+                shown[i] = "pending"
+        if snapshot["status"] in ("done", "failed"):
+            break
+        job.wait(snapshot["version"], timeout=JOB_POLL_INTERVAL)
+    if snapshot["error"]:
+        st.error(snapshot["error"])
+    if snapshot["delivery_id"]:
+        deliveries = st.session_state.setdefault("slack_deliveries", [])
+        if snapshot["delivery_id"] not in deliveries:
+            deliveries.append(snapshot["delivery_id"])
+    if show_timings and job.run is not None:
+        _show_timings(job.run)
 
 
 def main():
+    _start_services()
     st.title("Law Firm Social Media Post Generator")
     st.write("This tool generates 2 unique Instagram-style post ideas with graphics based on firm details.")
-    niche = st.selectbox("Select a legal niche", ["Corporate Law", "Family Law", "Criminal Law", "Intellectual Property", "Immigration Law", "Real Estate Law", "Tax Law"])
+    niche = st.selectbox("Select a legal niche", LEGAL_NICHES)
     selected_date = st.date_input("Select date (optional)")
+    stream_posts = st.checkbox(
+        "Stream posts as they are written",
+        value=True,
+        help="Show each post and start its image as soon as the model finishes it.",
+    )
+    export_format = st.selectbox("Download format", ["PNG", "WEBP", "JPEG"])
+    reuse_backgrounds = st.checkbox(
+        "Reuse saved backgrounds (fast previews)",
+        help="Serve matching backgrounds from the local library instead of generating new ones.",
+    )
+    draft_backgrounds = st.checkbox(
+        "Draft backgrounds (instant, rendered locally)",
+        help="Render backgrounds on this machine instead of calling the image model.",
+    )
+    show_timings = st.checkbox("Show timing panel", help="Break down where this run's time went, stage by stage.")
 
+    queue = job_queue()
     if st.button("Generate Posts"):
-        with st.spinner("Generating post ideas and images..."):
-            date_override = selected_date or None
-            # Build context once so we can show the single trending headline
-            context = get_firm_context(niche, date_override=date_override)
-            posts = get_post_ideas(niche, num_posts=2, date_override=date_override)
-            # Show trending headline (non-holiday) once above the posts
-            if not context.get("is_holiday"):
-                headline = context.get("trending")
-                headline_url = context.get("trending_url")
-                st.markdown("**Today's trending topic:**")
-                if headline_url:
-                    st.markdown(f"- [{headline}]({headline_url})")
-                else:
-                    st.markdown(f"- {headline}")
-            images = []
-            image_paths = []
-            for i, post in enumerate(posts):
-                try:
-                    img = generate_image_from_context(context, post_text=post, variant_index=i)
-                    with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as tmpfile:
-                        image_path = write_text_on_image(
-                            img,
-                            post,
-                            output_path=tmpfile.name,
-                            is_holiday=bool(context.get("is_holiday")),
-                            style_variant=i
-                        )
-                        image_paths.append(image_path)
-                except Exception as e:
-                    st.warning(f"Image generation failed for post {i+1}: {e}")
-                    image_paths.append(None)
-            # Display posts with images and download buttons
-            for i, (post, img_path) in enumerate(zip(posts, image_paths), 1):
-                st.markdown(f"### Post {i}")
-                if img_path:
-                    st.image(img_path, caption=f"Post idea for {niche}")
-                    with open(img_path, "rb") as f:
-                        st.download_button(
-                            label=f"Download Post {i}",
-                            data=f,
-                            file_name=f"post_{i}_{niche.replace(' ', '_').lower()}.png",
-                            mime="image/png"
-                        )
-                st.write(post)
-            # Combine posts into a single message, e.g., as a numbered list
-            slack_message = "\n\n".join([f"{i+1}. {post}" for i, post in enumerate(posts)])
-            success = send_post_to_slack(slack_message)
-            if success:
-                st.success("Posts sent to Slack!")
-            else:
-                st.error("Failed to send posts to Slack.")
+        # Runs in the shared worker pool; an identical request already in progress is joined, not repeated
+        job = queue.submit(
+            niche,
+            selected_date or datetime.date.today(),
+            stream=stream_posts,
+            export_format=export_format,
+            cache_policy="reuse" if reuse_backgrounds else None,
+            engine="local" if draft_backgrounds else None,
+        )
+        st.session_state["job_id"] = job.id
+        # In the URL too, so a reloaded page finds the job again
+        st.query_params["job"] = job.id
+    job_id = st.session_state.get("job_id") or st.query_params.get("job")
+    job = queue.get(job_id) if job_id else None
+    if job is not None:
+        _follow_job(job, show_timings)
+    elif job_id:
+        st.caption("That generation has expired; click Generate Posts to start a new one.")
+    _show_deliveries()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,187 @@
+import datetime
+import random
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+import http_client
+from circuit_breaker import breaker, is_upstream_error
+from disk_cache import DiskCache
+from settings import get_settings
+
+NAGER_API_BASE = get_settings().nager_api_base
+# Holiday calendars change rarely (mostly when moon-sighting dates are confirmed)
+HOLIDAY_CACHE_TTL = get_settings().holiday_cache_ttl
+HOLIDAY_RETRY_BASE = get_settings().holiday_retry_base
+HOLIDAY_RETRY_MAX = get_settings().holiday_retry_max
+
+
+def fetch_public_holidays(year: int, country: str = "AE") -> Dict[str, str]:
+    """Fetch public holidays for a given year using the Nager.Date public API.
+
+    API: GET https://date.nager.at/api/v3/PublicHolidays/{year}/{country}
+    Returns mapping YYYY-MM-DD -> holiday name. Empty dict on failure, including while
+    the Nager.Date circuit is open.
+    """
+    try:
+        url = f"{NAGER_API_BASE}/PublicHolidays/{year}/{country}"
+        nager = breaker("nager")
+        resp = nager.call(http_client.get, url, timeout=nager.timeout(), failed=is_upstream_error)
+        if resp.status_code != 200:
+            return {}
+        data = resp.json()
+        results: Dict[str, str] = {}
+        for item in data:
+            date_str = item.get("date")  # e.g., "2025-12-02"
+            name = item.get("localName") or item.get("name")
+            if date_str and name:
+                results[date_str] = name
+        return results
+    except Exception:
+        return {}
+
+
+def fallback_uae_holidays(year: int) -> Dict[str, str]:
+    """Minimal fixed-date UAE holidays used while the API is unreachable."""
+    return {
+        f"{year}-01-01": "New Year's Day",
+        f"{year}-12-01": "Commemoration Day",
+        f"{year}-12-02": "UAE National Day (Day 1)",
+        f"{year}-12-03": "UAE National Day (Day 2)",
+    }
+
+
+class HolidayStore:
+    """Public holiday calendar persisted on disk with an in-memory date index.
+
+    Years are loaded from the disk cache or Nager.Date on first use and merged into a
+    single YYYY-MM-DD -> name dict, so lookups are O(1). A year is reloaded once it is
+    older than `ttl`; until the new calendar arrives lookups keep using the old one. A
+    failed fetch serves the stale calendar (or the fallback map) and is retried with
+    exponential backoff instead of being kept forever.
+    """
+
+    def __init__(self, country: str = "AE", ttl: float = HOLIDAY_CACHE_TTL):
+        self.country = country
+        self.ttl = ttl
+        self._cache = DiskCache(f"holidays_{country.lower()}", ttl=ttl, max_entries=32)
+        # Replaced as a whole under the lock, never changed in place, so lookups can read it without locking
+        self._index: Dict[str, str] = {}
+        # year -> monotonic time its calendar was fetched
+        self._loaded_at: Dict[int, float] = {}
+        # year -> set once the fetch in flight for it finishes
+        self._loading: Dict[int, threading.Event] = {}
+        # year -> (consecutive failures, monotonic time of next retry)
+        self._retry_at: Dict[int, Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+
+    def _is_fresh(self, year: int) -> bool:
+        loaded_at = self._loaded_at.get(year)
+        return loaded_at is not None and time.monotonic() - loaded_at < self.ttl
+
+    def _load_year(self, year: int) -> Tuple[Dict[str, str], float]:
+        """The year's calendar and its age in seconds: from disk while fresh, else from Nager.Date.
+
+        When the fetch fails, the stale copy on disk (if any) is returned as is.
+        """
+        cached = self._cache.get(str(year))
+        if cached is not None and cached[1] < self.ttl:
+            return cached
+        year_map = fetch_public_holidays(year, self.country)
+        if year_map:
+            self._cache.set(str(year), year_map)
+            return year_map, 0.0
+        return cached if cached is not None else ({}, 0.0)
+
+    def _ensure_year(self, year: int):
+        if self._is_fresh(year):
+            return
+        with self._lock:
+            if self._is_fresh(year):
+                return
+            failures, retry_at = self._retry_at.get(year, (0, 0.0))
+            if time.monotonic() < retry_at:
+                return
+            loading = self._loading.get(year)
+            fetching = loading is None
+            if fetching:
+                loading = self._loading[year] = threading.Event()
+            first_load = year not in self._loaded_at
+        if not fetching:
+            # Only a year with nothing to show yet waits for the fetch another thread started
+            if first_load:
+                loading.wait()
+            return
+        try:
+            # The network fetch runs outside the lock, so lookups for loaded years never queue behind it
+            year_map, age = self._load_year(year)
+        except Exception as e:
+            print(f"Holiday calendar {year} could not be loaded: {e}")
+            year_map, age = {}, 0.0
+        with self._lock:
+            try:
+                if year_map:
+                    prefix = f"{year}-"
+                    index = {k: v for k, v in self._index.items() if not k.startswith(prefix)}
+                    index.update(year_map)
+                    self._index = index
+                if year_map and age < self.ttl:
+                    self._loaded_at[year] = time.monotonic() - age
+                    self._retry_at.pop(year, None)
+                    return
+                delay = min(HOLIDAY_RETRY_MAX, HOLIDAY_RETRY_BASE * (2 ** failures))
+                self._retry_at[year] = (failures + 1, time.monotonic() + delay * random.uniform(0.8, 1.2))
+                if not year_map and self.country == "AE":
+                    index = dict(self._index)
+                    for date_str, name in fallback_uae_holidays(year).items():
+                        index.setdefault(date_str, name)
+                    self._index = index
+            finally:
+                del self._loading[year]
+                loading.set()
+
+    def year_map(self, year: int) -> Dict[str, str]:
+        """Return the YYYY-MM-DD -> holiday name mapping for a year."""
+        self._ensure_year(year)
+        prefix = f"{year}-"
+        with self._lock:
+            return {k: v for k, v in self._index.items() if k.startswith(prefix)}
+
+    def holiday_name(self, day: datetime.date) -> Optional[str]:
+        self._ensure_year(day.year)
+        return self._index.get(day.isoformat())
+
+    def holidays_between(self, start: datetime.date, end: datetime.date) -> Dict[datetime.date, str]:
+        """Return {date: holiday name} for every holiday from `start` to `end` inclusive."""
+        for year in range(start.year, end.year + 1):
+            self._ensure_year(year)
+        index = self._index
+        results: Dict[datetime.date, str] = {}
+        day = start
+        while day <= end:
+            name = index.get(day.isoformat())
+            if name:
+                results[day] = name
+            day += datetime.timedelta(days=1)
+        return results
+
+    def warm(self, years: Optional[Iterable[int]] = None, background: bool = True):
+        """Load the given years (default: current and next) so first lookups don't block.
+
+        Years whose calendar is older than the TTL are fetched again, so a daily warm keeps them current.
+        """
+        if years is None:
+            this_year = datetime.date.today().year
+            years = (this_year, this_year + 1)
+        years = [year for year in years if not self._is_fresh(year)]
+        if not years:
+            return
+
+        def _warm():
+            for year in years:
+                self._ensure_year(year)
+
+        if background:
+            threading.Thread(target=_warm, daemon=True).start()
+        else:
+            _warm()
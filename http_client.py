@@ -0,0 +1,171 @@
+import email.utils
+import random
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Iterable, List, Optional
+
+from circuit_breaker import DeadlineExceeded, cap_timeout, time_left
+from settings import get_settings
+
+if TYPE_CHECKING:
+    import requests
+
+HTTP_CONNECT_TIMEOUT = get_settings().http_connect_timeout
+HTTP_READ_TIMEOUT = get_settings().http_read_timeout
+HTTP_MAX_RETRIES = get_settings().http_max_retries
+# Keep-alive connections kept per host
+HTTP_POOL_SIZE = get_settings().http_pool_size
+
+RETRY_STATUSES = {429, 502, 503, 504}
+# Only these are safe to resend after the request may already have reached the server
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+# requests is imported with the first session, keeping it off the import path of every module
+_session: Optional["requests.Session"] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> "requests.Session":
+    """Process-wide session, so every upstream reuses pooled keep-alive connections."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=0)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def retry_after_seconds(response: "requests.Response") -> Optional[float]:
+    """Parse a Retry-After header given either as seconds or as an HTTP date."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff_delay(attempt: int, base: float, cap: float) -> float:
+    # "Full jitter": spreads retries from concurrent callers instead of synchronising them
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def never_sent(error: BaseException) -> bool:
+    """Whether a failed request certainly never reached the server, so sending it again can't duplicate it."""
+    import requests
+    from urllib3.exceptions import NewConnectionError
+
+    if isinstance(error, (requests.ConnectTimeout, DeadlineExceeded)):
+        return True
+    if not isinstance(error, requests.ConnectionError):
+        return False
+    # Refused connections and DNS failures come wrapped in urllib3's MaxRetryError
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, (NewConnectionError, ConnectionRefusedError))
+
+
+def _can_wait(delay: float) -> bool:
+    # A retry that would start after the request deadline is pointless
+    left = time_left()
+    return left is None or delay < left
+
+
+def request(
+    method: str,
+    url: str,
+    *,
+    timeout: Optional[float] = None,
+    retries: Optional[int] = None,
+    backoff: float = 0.5,
+    max_backoff: float = 20.0,
+    **kwargs: Any,
+) -> "requests.Response":
+    """Send a request through the pooled session with unified timeouts and retries.
+
+    `timeout` is the read timeout in seconds (default HTTP_READ_TIMEOUT); connecting is
+    bounded by HTTP_CONNECT_TIMEOUT. 429/502/503/504 responses and connection errors are
+    retried with jittered exponential backoff, honouring Retry-After. For non-idempotent
+    methods, only connection errors before anything was sent (connect timeouts, refused
+    connections) are retried, and read timeouts never are. The last response is returned whatever its status.
+    Inside `circuit_breaker.deadline`, timeouts are capped by the time left, no retry
+    waits past it, and DeadlineExceeded is raised once it has passed.
+    """
+    method = method.upper()
+    retries = HTTP_MAX_RETRIES if retries is None else retries
+    read_timeout = HTTP_READ_TIMEOUT if timeout is None else timeout
+    session = get_session()
+    import requests
+
+    for attempt in range(retries + 1):
+        attempt_timeout = cap_timeout(read_timeout)
+        try:
+            response = session.request(method, url, timeout=(min(HTTP_CONNECT_TIMEOUT, attempt_timeout), attempt_timeout), **kwargs)
+        except requests.ConnectionError as e:
+            delay = _backoff_delay(attempt, backoff, max_backoff)
+            # A POST whose connection dropped mid-request may already have been processed
+            if attempt >= retries or (method not in IDEMPOTENT_METHODS and not never_sent(e)) or not _can_wait(delay):
+                raise
+        except requests.Timeout:
+            delay = _backoff_delay(attempt, backoff, max_backoff)
+            if attempt >= retries or method not in IDEMPOTENT_METHODS or not _can_wait(delay):
+                raise
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                return response
+            retry_after = retry_after_seconds(response)
+            if retry_after is not None and retry_after > max_backoff:
+                # The server asked for a longer pause than we're willing to wait
+                return response
+            delay = retry_after if retry_after is not None else _backoff_delay(attempt, backoff, max_backoff)
+            if not _can_wait(delay):
+                return response
+            response.close()
+        time.sleep(delay)
+    raise RuntimeError("unreachable")
+
+
+def get(url: str, **kwargs: Any) -> "requests.Response":
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs: Any) -> "requests.Response":
+    return request("POST", url, **kwargs)
+
+
+async def arequest(method: str, url: str, **kwargs: Any) -> "requests.Response":
+    """Asyncio variant of `request`; runs on a worker thread so it still uses the shared pool."""
+    import asyncio
+
+    return await asyncio.to_thread(request, method, url, **kwargs)
+
+
+async def gather_limited(calls: Iterable[Callable[[], Awaitable[Any]]], limit: int = HTTP_POOL_SIZE) -> List[Any]:
+    """Run coroutine factories concurrently, at most `limit` at a time; exceptions are returned, not raised."""
+    import asyncio
+
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def _run(call):
+        async with semaphore:
+            return await call()
+
+    return await asyncio.gather(*(_run(call) for call in calls), return_exceptions=True)
+
+
+def fan_out(calls: Iterable[Callable[[], Awaitable[Any]]], limit: int = HTTP_POOL_SIZE) -> List[Any]:
+    """Blocking helper that runs `gather_limited` from synchronous code."""
+    import asyncio
+
+    return asyncio.run(gather_limited(list(calls), limit=limit))
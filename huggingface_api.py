@@ -1,16 +1,107 @@
-import os
-import requests
+import functools
+import random
+import http_client
+import metrics
 from PIL import Image
 from io import BytesIO
-from dotenv import load_dotenv
+from typing import Optional
+from background_library import BackgroundLibrary
+from circuit_breaker import breaker, is_upstream_error
+from settings import get_settings
 
-load_dotenv()
-HUGGINGFACE_API_KEY = os.getenv("HUGGINGFACE_API_KEY")
-HUGGINGFACE_API_URL = "https://api-inference.huggingface.co/models/stabilityai/stable-diffusion-xl-base-1.0"
+HUGGINGFACE_API_KEY = get_settings().huggingface_api_key
+HUGGINGFACE_API_URL = get_settings().huggingface_api_url
+# "off": always call the API and keep nothing; "fresh": call the API and store the result
+# in the background library; "reuse": serve a stored background when one matches
+BACKGROUND_CACHE_POLICY = get_settings().background_cache_policy
+# "remote": SDXL, with procedural backgrounds as the fallback; "local": procedural only (no API calls)
+IMAGE_ENGINE = get_settings().image_engine
 
-def generate_image_from_context(context, post_text=None, variant_index: int = 0):
+# Style variants to diversify outputs between posts
+STYLE_VARIANTS = [
+    "glassmorphism, soft diagonal light streaks, dark blue gradients, subtle depth of field",
+    "dark slate texture, minimal geometric linework, cyan-orange accent glows, asymmetric composition",
+    "dramatic vignette spotlight, metallic highlights, elegant shadows, premium studio lighting",
+]
+
+
+@functools.lru_cache(maxsize=None)
+def background_library() -> BackgroundLibrary:
+    return BackgroundLibrary()
+
+
+def resolve_engine(engine: Optional[str] = None) -> str:
+    return (engine or IMAGE_ENGINE).lower()
+
+
+def _procedural_background(context, holiday, style_index: int, post_text=None, seed: Optional[int] = None):
+    # numpy loads with the first procedural render, not with the app
+    from procedural_bg import background_seed, render_background
+
+    if seed is None:
+        seed = background_seed(context['niche'], holiday, style_index, post_text)
+    metrics.annotate(engine="local")
+    return render_background(context['niche'], style_index, seed, holiday)
+
+
+def _fallback_background(context, holiday, style_index: int, reason: str, post_text=None):
+    """A stored background for this niche and style if the library has one, else a procedural one."""
+    # Counted as a fallback rather than an error
+    metrics.annotate(fallback=True, reason=reason)
+    try:
+        found = background_library().find(context['niche'], holiday, style_index)
+    except Exception as e:
+        print(f"Background library unavailable: {e}")
+        found = None
+    if found is not None:
+        metrics.annotate(cache_hit=True)
+        return found[1]
+    try:
+        return _procedural_background(context, holiday, style_index, post_text)
+    except Exception as e:
+        print(f"Procedural background failed: {e}")
+        return Image.new("RGBA", (1024, 1024), (7, 23, 52, 255))
+
+
+@metrics.instrument("background_image")
+def generate_image_from_context(context, post_text=None, variant_index: int = 0, *, cache_policy: Optional[str] = None,
+                                seed: Optional[int] = None, engine: Optional[str] = None):
+    """Generate a background for a post.
+
+    `engine` ("remote" or "local", default IMAGE_ENGINE) picks SDXL or the local procedural
+    renderer; "local" never calls the API and ignores the background library.
+
+    `cache_policy` ("off", "fresh" or "reuse", default BACKGROUND_CACHE_POLICY) controls the
+    background library, keyed by (niche, holiday, style variant, seed). With "reuse", a stored
+    background for `seed` (or, without a seed, the most recently used one for this niche and
+    variant) is returned without calling the API. When the API fails, is over its latency
+    budget or its circuit is open, a stored background (or a procedural one) is returned.
+    """
     import hashlib, time
-    unique_hash = hashlib.md5((str(context)+str(post_text)+str(time.time())).encode()).hexdigest()[:8] if post_text else str(int(time.time()))
+    policy = (cache_policy or BACKGROUND_CACHE_POLICY).lower()
+    holiday = context.get("holiday_name") if context.get("is_holiday") else None
+    style_index = variant_index % len(STYLE_VARIANTS)
+    if resolve_engine(engine) == "local":
+        return _procedural_background(context, holiday, style_index, post_text, seed)
+    if policy == "reuse":
+        library = background_library()
+        if seed is not None:
+            cached = library.get(context['niche'], holiday, style_index, seed)
+            if cached is not None:
+                metrics.annotate(cache_hit=True)
+                return cached
+        else:
+            found = library.find(context['niche'], holiday, style_index)
+            if found is not None:
+                metrics.annotate(cache_hit=True)
+                return found[1]
+    if policy in ("fresh", "reuse") and seed is None:
+        seed = random.randrange(2 ** 31)
+    if seed is not None:
+        # A seeded request is reproducible, so the prompt must not vary with the clock
+        unique_hash = f"{seed:08x}"
+    else:
+        unique_hash = hashlib.md5((str(context)+str(post_text)+str(time.time())).encode()).hexdigest()[:8] if post_text else str(int(time.time()))
     holiday_suffix = ""
     if context.get("is_holiday"):
         holiday_name = context.get("holiday_name", "UAE public holiday")
@@ -21,13 +112,7 @@ def generate_image_from_context(context, post_text=None, variant_index: int = 0)
             f"Avoid flags or literal text; keep it respectful, modern, minimal, and professional. "
         )
 
-    # Style variants to diversify outputs between posts
-    style_variants = [
-        "glassmorphism, soft diagonal light streaks, dark blue gradients, subtle depth of field",
-        "dark slate texture, minimal geometric linework, cyan-orange accent glows, asymmetric composition",
-        "dramatic vignette spotlight, metallic highlights, elegant shadows, premium studio lighting",
-    ]
-    style_suffix = style_variants[variant_index % len(style_variants)]
+    style_suffix = STYLE_VARIANTS[style_index]
 
     prompt = (
         f"Modern, clean, visually striking Instagram background for a law firm specializing in {context['niche']}. "
@@ -50,13 +135,24 @@ def generate_image_from_context(context, post_text=None, variant_index: int = 0)
         "people, person, face, human, silhouette, crowd, hands, portrait, selfie, text, watermark"
     )
     payload = {"inputs": prompt, "parameters": {"negative_prompt": negative_prompt, "guidance_scale": 7}}
+    if seed is not None:
+        payload["parameters"]["seed"] = seed
+    huggingface = breaker("huggingface")
     try:
-        response = requests.post(HUGGINGFACE_API_URL, headers=headers, json=payload, timeout=60)
+        response = huggingface.call(http_client.post, HUGGINGFACE_API_URL, headers=headers, json=payload,
+                                    timeout=huggingface.timeout(), retries=1, failed=is_upstream_error)
+        metrics.annotate(cache_hit=False, status_code=response.status_code, response_bytes=len(response.content))
         if response.status_code == 200:
-            return Image.open(BytesIO(response.content)).convert("RGBA")
+            image = Image.open(BytesIO(response.content)).convert("RGBA")
+            if policy in ("fresh", "reuse"):
+                try:
+                    background_library().put(context['niche'], holiday, style_index, seed, image)
+                except OSError as e:
+                    print(f"Could not store background: {e}")
+            return image
         else:
             print(f"HuggingFace API error: {response.status_code} {response.text}")
-            return Image.new("RGBA", (1024, 1024), (7, 23, 52, 255))
+            return _fallback_background(context, holiday, style_index, f"HTTP {response.status_code}", post_text)
     except Exception as e:
         print(f"Image generation failed: {e}")
-        return Image.new("RGBA", (1024, 1024), (7, 23, 52, 255))
\ No newline at end of file
+        return _fallback_background(context, holiday, style_index, f"{type(e).__name__}: {e}", post_text)
\ No newline at end of file
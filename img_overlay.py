@@ -1,39 +1,158 @@
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+import functools
 import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Dict, NamedTuple, Optional, Tuple
 
-def write_text_on_image(image, text, output_path=None, *, is_holiday: bool = False, style_variant: int = 0):
-    from PIL import ImageFilter
-    import random
-    draw = ImageDraw.Draw(image)
-    width, height = image.size
-    font_path = "Montserrat-Bold.ttf"
-    font_size = max(48, width // 16)
+import metrics
+
+FONT_PATH = "Montserrat-Bold.ttf"
+FALLBACK_FONT_PATH = "arial.ttf"
+# Number of distinct cached bokeh layouts per image size
+BOKEH_VARIANTS = 8
+# Width in pixels of the dark halo drawn behind the text
+GLOW_RADIUS = 2
+
+EXPORT_SIZES = {
+    "square": (1080, 1080),    # Instagram feed
+    "portrait": (1080, 1350),  # Instagram portrait
+    "story": (1080, 1920),     # Instagram story
+    "preview": (360, 360),     # lightweight UI thumbnail
+}
+EXPORT_MIME_TYPES = {"PNG": "image/png", "WEBP": "image/webp", "JPEG": "image/jpeg"}
+
+
+class ExportedImage(NamedTuple):
+    target: str
+    size: Tuple[int, int]
+    format: str
+    mime: str
+    data: bytes
+
+
+@functools.lru_cache(maxsize=16)
+def _shadow_gradient(width: int, gradient_height: int, tint: Tuple[int, int, int]) -> Image.Image:
+    """Shadow band fading from transparent at the top to alpha 220 at the bottom."""
+    alpha = Image.linear_gradient("L").resize((width, gradient_height), Image.BILINEAR).point(lambda v: v * 220 // 255)
+    gradient = Image.new("RGBA", (width, gradient_height), tint + (0,))
+    gradient.putalpha(alpha)
+    return gradient
+
+
+def _bokeh_layer(size: Tuple[int, int], seed: int) -> Image.Image:
+    width, height = size
+    rng = random.Random(seed)
+    bokeh_layer = Image.new("RGBA", size, (0,0,0,0))
+    bokeh_draw = ImageDraw.Draw(bokeh_layer)
+    num_dots = max(12, (width * height) // 180000)  # scale with size
+    palette = [
+        (212,175,55,90),   # soft gold
+        (200,200,200,70),  # silver
+        (230, 60, 60, 60), # deep red
+        (70, 160, 120, 60) # emerald
+    ]
+    for _ in range(num_dots):
+        r = rng.randint(6, 16)
+        x = rng.randint(0, width)
+        y = rng.randint(int(height*0.55), height)  # mostly lower half
+        color = rng.choice(palette)
+        bokeh_draw.ellipse((x-r, y-r, x+r, y+r), fill=color)
+    return bokeh_layer
+
+
+@functools.lru_cache(maxsize=12)
+def _overlay_layer(size: Tuple[int, int], tint: Tuple[int, int, int], mode: str, bokeh_seed: Optional[int]) -> Image.Image:
+    """Full-frame shadow (and optional bokeh) layer, built once per (size, tint, mode, bokeh layout).
+
+    Callers composite it onto the background in a single pass; it must not be modified.
+    """
+    width, height = size
+    gradient_height = int(height * 0.38)
+    gradient = _shadow_gradient(width, gradient_height, tint)
+    overlay = Image.new("RGBA", size, (0,0,0,0))
+    if mode == "center_left":
+        g_rot = gradient.rotate(90, expand=True)
+        overlay.paste(g_rot, (0, (height - g_rot.size[1]) // 2), g_rot)
+    else:  # bottom_center, center
+        overlay.paste(gradient, (0, height - gradient_height), gradient)
+    if bokeh_seed is not None:
+        overlay = Image.alpha_composite(overlay, _bokeh_layer(size, bokeh_seed))
+    return overlay
+
+
+@functools.lru_cache(maxsize=16)
+def load_font(path: str, size: int):
+    """Process-wide TrueType font cache keyed by (path, size)."""
+    return ImageFont.truetype(path, size)
+
+
+@functools.lru_cache(maxsize=16)
+def _overlay_font(size: int):
     try:
-        if os.path.exists(font_path):
-            font = ImageFont.truetype(font_path, font_size)
-        else:
-            font = ImageFont.truetype("arial.ttf", font_size)
-    except:
-        font = ImageFont.load_default()
-        font_size = 32
-    max_width = width - 120
-    words = text.split()
-    lines = []
-    line = ""
-    for word in words:
-        test_line = line + (" " if line else "") + word
-        bbox = draw.textbbox((0, 0), test_line, font=font)
-        w = bbox[2] - bbox[0]
-        if w <= max_width:
-            line = test_line
+        if os.path.exists(FONT_PATH):
+            return load_font(FONT_PATH, size)
+        return load_font(FALLBACK_FONT_PATH, size)
+    except OSError:
+        return ImageFont.load_default()
+
+
+@functools.lru_cache(maxsize=4096)
+def _text_width(font, text: str) -> float:
+    return font.getlength(text)
+
+
+@functools.lru_cache(maxsize=256)
+def _layout_text(text: str, font, max_width: int) -> Tuple[Tuple[str, ...], Tuple[float, ...], int]:
+    """Greedy word wrap using memoised per-word widths; returns (lines, line widths, line height)."""
+    space = _text_width(font, " ")
+    lines, widths = [], []
+    line, line_width = [], 0.0
+    for word in text.split():
+        word_width = _text_width(font, word)
+        test_width = line_width + space + word_width if line else word_width
+        if test_width <= max_width or not line:
+            line.append(word)
+            line_width = test_width
         else:
-            lines.append(line)
-            line = word
+            lines.append(" ".join(line))
+            widths.append(line_width)
+            line, line_width = [word], word_width
     if line:
-        lines.append(line)
-    bbox = draw.textbbox((0, 0), "A", font=font)
+        lines.append(" ".join(line))
+        widths.append(line_width)
+    bbox = font.getbbox("A")
     line_height = (bbox[3] - bbox[1]) + 18  # More line spacing
+    return tuple(lines), tuple(widths), line_height
+
+
+def _draw_glow(image: Image.Image, lines, positions, font, line_height: int):
+    """Darken a soft halo around the text in one pass, using a dilated and blurred mask of the block."""
+    width, height = image.size
+    top = max(0, int(min(y for _, y in positions)) - GLOW_RADIUS * 3)
+    bottom = min(height, int(max(y for _, y in positions)) + line_height + GLOW_RADIUS * 3)
+    if bottom <= top:
+        return
+    mask = Image.new("L", (width, bottom - top), 0)
+    mask_draw = ImageDraw.Draw(mask)
+    for line, (x, y) in zip(lines, positions):
+        mask_draw.text((x, y - top), line, font=font, fill=255)
+    mask = mask.filter(ImageFilter.MaxFilter(GLOW_RADIUS * 2 + 1)).filter(ImageFilter.GaussianBlur(GLOW_RADIUS / 2))
+    image.paste((0, 0, 0, 255), (0, top, width, bottom), mask)
+
+
+@metrics.instrument("overlay")
+def render_post_image(image, text, *, is_holiday: bool = False, style_variant: int = 0) -> Image.Image:
+    """Overlay the post text on a background and return the final RGB image, without saving it."""
+    if image.mode != "RGBA":
+        image = image.convert("RGBA")
+    width, height = image.size
+    font = _overlay_font(max(48, width // 16))
+    max_width = width - 120
+    lines, line_widths, line_height = _layout_text(text, font, max_width)
     total_height = line_height * len(lines)
+    metrics.annotate(width=width, height=height, lines=len(lines))
     # Decide placement and alignment based on variant
     placement_modes = ["bottom_center", "center_left", "center"]
     mode = placement_modes[style_variant % len(placement_modes)]
@@ -43,63 +162,90 @@ def write_text_on_image(image, text, output_path=None, *, is_holiday: bool = Fal
         y_text = (height - total_height) / 2
     else:  # center
         y_text = (height - total_height) / 2
-    gradient_height = int(height * 0.38)
     base_tint = (0, 0, 0)
     if is_holiday:
         # subtle warm tint for holiday vibe
         base_tint = (22, 18, 8)  # very dark warm tone
-    gradient = Image.new("RGBA", (width, gradient_height), (0,0,0,0))
-    for y in range(gradient_height):
-        alpha = int(220 * (y / gradient_height))
-        ImageDraw.Draw(gradient).rectangle([0, y, width, y+1], fill=(base_tint[0], base_tint[1], base_tint[2], alpha))
-    overlay = Image.new("RGBA", image.size, (0,0,0,0))
-    if mode == "bottom_center":
-        overlay.paste(gradient, (0, height - gradient_height), gradient)
-    else:
-        from PIL import ImageOps
-        g_rot = gradient.rotate(90, expand=True)
-        if mode == "center_left":
-            overlay.paste(g_rot, (0, (height - g_rot.size[1]) // 2), g_rot)
-        else:  # center
-            overlay.paste(gradient, (0, height - gradient_height), gradient)
-    if is_holiday:
-        import random
-        bokeh_layer = Image.new("RGBA", image.size, (0,0,0,0))
-        bokeh_draw = ImageDraw.Draw(bokeh_layer)
-        num_dots = max(12, (width * height) // 180000)  # scale with size
-        palette = [
-            (212,175,55,90),   # soft gold
-            (200,200,200,70),  # silver
-            (230, 60, 60, 60), # deep red
-            (70, 160, 120, 60) # emerald
-        ]
-        for _ in range(num_dots):
-            r = random.randint(6, 16)
-            x = random.randint(0, width)
-            y = random.randint(int(height*0.55), height)  # mostly lower half
-            color = random.choice(palette)
-            bokeh_draw.ellipse((x-r, y-r, x+r, y+r), fill=color)
-        overlay = Image.alpha_composite(overlay, bokeh_layer)
+    # Holiday bokeh comes from a small pool of seeded layouts so the layer can be cached
+    bokeh_seed = random.randrange(BOKEH_VARIANTS) if is_holiday else None
+    overlay = _overlay_layer(image.size, base_tint, mode, bokeh_seed)
 
     combined = Image.alpha_composite(image, overlay)
-    draw = ImageDraw.Draw(combined)
-    # Always use white text
-    text_color = (255,255,255)
-    # Draw text lines
-    for line in lines:
-        bbox = draw.textbbox((0, 0), line, font=font)
-        w = bbox[2] - bbox[0]
+    positions = []
+    for w in line_widths:
         if mode == "center_left":
             x = max(40, width * 0.08)
         else:
             x = (width - w) / 2
-        # Draw glow (multiple blurred shadows)
-        for dx, dy in [(-2,0),(2,0),(0,-2),(0,2),(-2,-2),(2,2),(-2,2),(2,-2)]:
-            draw.text((x+dx, y_text+dy), line, font=font, fill=(0,0,0,90))
-        # Draw main text
-        draw.text((x, y_text), line, font=font, fill=text_color + (255,))
+        positions.append((x, y_text))
         y_text += line_height
+    if lines:
+        _draw_glow(combined, lines, positions, font, line_height)
+    draw = ImageDraw.Draw(combined)
+    # Always use white text
+    text_color = (255,255,255)
+    for line, position in zip(lines, positions):
+        draw.text(position, line, font=font, fill=text_color + (255,))
+    return combined.convert("RGB")
+
+
+def write_text_on_image(image, text, output_path=None, *, is_holiday: bool = False, style_variant: int = 0):
+    rendered = render_post_image(image, text, is_holiday=is_holiday, style_variant=style_variant)
     if output_path is None:
         output_path = "final_post.png"
-    combined.convert("RGB").save(output_path)
-    return output_path
\ No newline at end of file
+    rendered.save(output_path)
+    return output_path
+
+
+def _fit_to_canvas(rendered: Image.Image, size: Tuple[int, int]) -> Image.Image:
+    """Resize a square render to `size`; taller formats get a blurred fill above and below."""
+    width, height = size
+    if rendered.size == size:
+        return rendered
+    if rendered.width == rendered.height and width == height:
+        return rendered.resize(size, Image.LANCZOS)
+    scale = width / rendered.width
+    foreground = rendered.resize((width, round(rendered.height * scale)), Image.LANCZOS)
+    # Blur a small copy and upscale it; much cheaper than blurring at full size
+    cover = max(width / rendered.width, height / rendered.height)
+    small = rendered.resize((max(1, round(rendered.width * cover / 8)), max(1, round(rendered.height * cover / 8))), Image.BILINEAR)
+    background = small.filter(ImageFilter.GaussianBlur(4)).resize((round(rendered.width * cover), round(rendered.height * cover)), Image.BILINEAR)
+    left, top = (background.width - width) // 2, (background.height - height) // 2
+    canvas = background.crop((left, top, left + width, top + height))
+    canvas.paste(foreground, (0, (height - foreground.height) // 2))
+    return canvas
+
+
+def _encode(image: Image.Image, fmt: str) -> bytes:
+    buffer = BytesIO()
+    if fmt == "JPEG":
+        image.save(buffer, format="JPEG", quality=88, optimize=True, progressive=True)
+    elif fmt == "WEBP":
+        image.save(buffer, format="WEBP", quality=90, method=4)
+    else:
+        image.save(buffer, format="PNG", compress_level=6)
+    return buffer.getvalue()
+
+
+@metrics.instrument("export")
+def export_post_image(rendered: Image.Image, targets=("square", "portrait", "story", "preview"), fmt: str = "PNG") -> Dict[str, ExportedImage]:
+    """Produce every target size from one render, encoded in parallel to in-memory buffers.
+
+    `targets` are keys of EXPORT_SIZES; `fmt` is "PNG", "WEBP" or "JPEG". The preview is
+    always JPEG, since it is only meant for display.
+    """
+    fmt = fmt.upper()
+    if fmt not in EXPORT_MIME_TYPES:
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+    def _export(target: str) -> ExportedImage:
+        size = EXPORT_SIZES[target]
+        target_fmt = "JPEG" if target == "preview" else fmt
+        image = _fit_to_canvas(rendered, size)
+        return ExportedImage(target, size, target_fmt, EXPORT_MIME_TYPES[target_fmt], _encode(image, target_fmt))
+
+    # Pillow releases the GIL while resizing and encoding, so threads give real parallelism
+    with ThreadPoolExecutor(max_workers=len(targets) or 1) as pool:
+        exports = {export.target: export for export in pool.map(_export, targets)}
+    metrics.annotate(format=fmt, targets=len(exports), output_bytes=sum(len(e.data) for e in exports.values()))
+    return exports
\ No newline at end of file
@@ -0,0 +1,226 @@
+"""Process-wide queue of generation jobs, shared by every Streamlit session.
+
+A click on "Generate Posts" submits a job instead of running the pipeline inside the
+user's script run. Jobs run on a small worker pool (JOB_WORKERS), so concurrent users
+can't multiply the load on the upstream APIs, and every job shares one cap on in-flight
+image requests. An identical request (same niche, date and options) while one is queued
+or running joins that job instead of starting another. Jobs keep running when the page
+reruns or is reloaded; the UI finds them again by id and follows their progress.
+"""
+import datetime
+import functools
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+import metrics
+from circuit_breaker import deadline
+from settings import get_settings
+
+_settings = get_settings()
+JOB_WORKERS = _settings.job_workers
+# Finished jobs stay available this long, so a reloaded page can still show the results
+JOB_RESULT_TTL = _settings.job_result_ttl
+IMAGE_MAX_CONCURRENCY = _settings.image_max_concurrency
+
+EXPORT_TARGETS = ("square", "portrait", "story", "preview")
+
+
+class Job:
+    """One generation request and its progress so far; updated by a worker, read by any session."""
+
+    def __init__(self, key: Tuple, niche: str, day: datetime.date, options: Dict[str, Any]):
+        self.id = uuid.uuid4().hex[:12]
+        self.key = key
+        self.niche = niche
+        self.day = day
+        self.options = options
+        self.status = "queued"  # queued, running, done or failed
+        self.stage = "Waiting for a free worker"
+        self.context: Optional[Dict] = None
+        self.posts = []
+        self.images: Dict[int, Dict] = {}
+        self.image_errors: Dict[int, str] = {}
+        self.error: Optional[str] = None
+        self.delivery_id: Optional[str] = None
+        self.run: Optional[metrics.RunMetrics] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.version = 0
+        self._changed = threading.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def update(self, **fields):
+        with self._changed:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            if self.finished and self.finished_at is None:
+                self.finished_at = time.time()
+            self.version += 1
+            self._changed.notify_all()
+
+    def add_post(self, post: str):
+        with self._changed:
+            self.posts.append(post)
+            self.version += 1
+            self._changed.notify_all()
+
+    def set_image(self, index: int, exports: Optional[Dict], error: Optional[BaseException] = None):
+        with self._changed:
+            if exports:
+                self.images[index] = exports
+            if error is not None:
+                self.image_errors[index] = str(error)
+            self.version += 1
+            self._changed.notify_all()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """A consistent copy of the progress, including `version` for `wait`."""
+        with self._changed:
+            return {
+                "id": self.id, "status": self.status, "stage": self.stage, "context": self.context,
+                "posts": list(self.posts), "images": dict(self.images), "image_errors": dict(self.image_errors),
+                "error": self.error, "delivery_id": self.delivery_id, "version": self.version,
+            }
+
+    def wait(self, version: int, timeout: Optional[float] = None) -> int:
+        """Block until the job changes past `version` or finishes; returns the current version."""
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version or self.finished, timeout)
+            return self.version
+
+
+class JobQueue:
+    def __init__(self, workers: int = JOB_WORKERS, inference_slots: int = IMAGE_MAX_CONCURRENCY):
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="job")
+        self._jobs: Dict[str, Job] = {}
+        self._active: Dict[Tuple, Job] = {}
+        self._lock = threading.Lock()
+        # One SDXL budget for all jobs, however many sessions are generating
+        self.inference_slots = threading.BoundedSemaphore(max(1, inference_slots))
+
+    def submit(self, niche: str, day: datetime.date, **options) -> Job:
+        """Queue a generation, or return the queued/running job for the same niche, date and options."""
+        key = (niche, day.isoformat(), tuple(sorted(options.items())))
+        with self._lock:
+            self._prune()
+            job = self._active.get(key)
+            if job is not None:
+                return job
+            job = Job(key, niche, day, options)
+            self._jobs[job.id] = job
+            self._active[key] = job
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def position(self, job: Job) -> int:
+        """How many queued jobs are ahead of `job`; 0 once it is running."""
+        with self._lock:
+            if job.status != "queued":
+                return 0
+            return sum(1 for other in self._jobs.values() if other.status == "queued" and other.created_at < job.created_at)
+
+    def _prune(self):
+        cutoff = time.time() - JOB_RESULT_TTL
+        for job_id in [i for i, job in self._jobs.items() if job.finished and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def _run(self, job: Job):
+        try:
+            # The deadline starts when a worker picks the job up, not while it waits in the queue
+            with metrics.collect_run(job.niche) as run, deadline():
+                job.update(status="running", stage="Preparing", run=run)
+                run_generation(job, self.inference_slots)
+            job.update(status="done", stage="Done")
+        except Exception as e:
+            print(f"Job {job.id} failed: {e}")
+            job.update(status="failed", stage="Failed", error=str(e))
+        finally:
+            with self._lock:
+                if self._active.get(job.key) is job:
+                    del self._active[job.key]
+
+
+@functools.lru_cache(maxsize=None)
+def job_queue() -> JobQueue:
+    """Process-wide job queue; every Streamlit session submits to the same one."""
+    return JobQueue()
+
+
+def _slack_image(i: int, niche: str, exports: Dict) -> Tuple[str, bytes]:
+    """(filename, data) of the feed-size export that goes to Slack with the post."""
+    square = exports["square"]
+    return f"post_{i+1}_{niche.replace(' ', '_').lower()}.{square.format.lower().replace('jpeg', 'jpg')}", square.data
+
+
+def run_generation(job: Job, inference_slots=None):
+    """The generation pipeline for one job: posts, images, then the Slack delivery.
+
+    Served from the ready queue when the scheduler pre-generated this niche and date.
+    Progress goes to `job` as it happens; errors that end the job are raised.
+    """
+    # Heavy modules load with the first job, not with the page
+    from content_api import RequestContext, get_post_ideas, stream_post_ideas
+    from img_overlay import export_post_image
+    from pipeline import ImagePipeline, render_post_images
+    from ready_queue import take_ready
+    from slack_outbox import queue_posts
+    from PIL import Image
+
+    options = job.options
+    export_format = options.get("export_format", "PNG")
+    ready = take_ready(job.niche, job.day)
+    if ready:
+        job.update(context=ready["context"], stage="Loading pre-generated posts")
+        for i, stored in enumerate(ready["posts"]):
+            job.add_post(stored["text"])
+            exports = None
+            if stored.get("image"):
+                with Image.open(stored["image"]) as img:
+                    exports = export_post_image(img.convert("RGB"), targets=EXPORT_TARGETS, fmt=export_format)
+            job.set_image(i, exports)
+    else:
+        # Resolve context once; the headline, LLM prompt, images and Slack message all share it
+        context = RequestContext(job.niche, date_override=job.day).resolve()
+        job.update(context=context, stage="Writing posts")
+        render_options = dict(cache_policy=options.get("cache_policy"), export_targets=EXPORT_TARGETS,
+                              export_format=export_format, engine=options.get("engine"), inference_slots=inference_slots)
+        if options.get("stream", True):
+            # Each post's image starts as soon as the model finishes its line
+            with ImagePipeline(context, **render_options) as pipeline:
+                try:
+                    for post in stream_post_ideas(job.niche, num_posts=2, context=context):
+                        pipeline.submit(len(job.posts), post)
+                        job.add_post(post)
+                        for i, exports, error in pipeline.done():
+                            job.set_image(i, exports, error)
+                except Exception as e:
+                    if not job.posts:
+                        raise
+                    job.update(error=str(e))
+                job.update(stage="Rendering images")
+                for i, exports, error in pipeline.completed():
+                    job.set_image(i, exports, error)
+        else:
+            posts = get_post_ideas(job.niche, num_posts=2, context=context)
+            if isinstance(posts, dict):
+                raise RuntimeError(posts.get("error"))
+            for post in posts:
+                job.add_post(post)
+            job.update(stage="Rendering images")
+            for i, exports, error in render_post_images(context, posts, **render_options):
+                job.set_image(i, exports, error)
+    if not job.posts:
+        raise RuntimeError("No posts were generated.")
+    # One Slack message for the whole run, images threaded under it; the sender delivers it in the background
+    slack_images = [_slack_image(i, job.niche, job.images[i]) for i in sorted(job.images)]
+    job.update(delivery_id=queue_posts(job.posts, job.context, slack_images))
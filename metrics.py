@@ -0,0 +1,293 @@
+"""Lightweight per-stage timing and metrics.
+
+Instrumented stages record a span with their duration, status (ok, fallback or error) and
+attributes such as payload sizes and cache hits. Every finished span is:
+    - appended to a JSON-lines log (METRICS_LOG, default .cache/metrics.jsonl)
+    - aggregated per stage for the local metrics endpoint (METRICS_PORT; 0 disables it),
+      served as Prometheus text at /metrics and as JSON at /metrics.json
+    - collected into the active run (see `collect_run`) for the per-run timing panel
+The active span and run live in context variables; use `submit` to carry them into
+executor threads.
+"""
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from settings import get_settings
+
+METRICS_LOG = get_settings().metrics_log
+METRICS_LOG_MAX_BYTES = get_settings().metrics_log_max_bytes
+METRICS_PORT = get_settings().metrics_port
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("metrics_span", default=None)
+_current_run: contextvars.ContextVar = contextvars.ContextVar("metrics_run", default=None)
+_log_lock = threading.Lock()
+_server_lock = threading.Lock()
+_server = None
+
+
+class Span:
+    """One timed stage. Call `set` to attach attributes and `finish` exactly once."""
+
+    def __init__(self, name: str, **attrs):
+        parent = _current_span.get()
+        self.name = name
+        self.parent = parent.name if parent else None
+        self.run = _current_run.get()
+        self.attrs: Dict[str, Any] = dict(attrs)
+        self.started_at = time.time()
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+        self._t0 = time.perf_counter()
+
+    @property
+    def status(self) -> str:
+        if self.error:
+            return "error"
+        return "fallback" if self.attrs.get("fallback") else "ok"
+
+    def elapsed(self) -> float:
+        """Seconds since the span started."""
+        return time.perf_counter() - self._t0
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def fail(self, message: str):
+        self.error = message
+
+    def finish(self, error: Optional[BaseException] = None):
+        if self.duration is not None:
+            return
+        self.duration = self.elapsed()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        _record(self)
+
+    def as_dict(self) -> Dict[str, Any]:
+        record = {
+            "ts": round(self.started_at, 3),
+            "run_id": self.run.run_id if self.run else None,
+            "span": self.name,
+            "parent": self.parent,
+            "duration_ms": round(self.duration * 1000, 2) if self.duration is not None else None,
+            "status": self.status,
+        }
+        if self.error:
+            record["error"] = self.error
+        record.update(self.attrs)
+        return record
+
+
+class RunMetrics:
+    """Spans recorded during one generation run, e.g. a single "Generate Posts" click."""
+
+    def __init__(self, label: Optional[str] = None):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.label = label
+        self.spans: List[Span] = []
+        self.started = time.perf_counter()
+        self.wall_time: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """One row per stage in first-seen order: calls, total/max ms, errors, fallbacks, cache hits, bytes."""
+        rows: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            row = rows.setdefault(span.name, {"stage": span.name, "calls": 0, "total_ms": 0.0, "max_ms": 0.0,
+                                              "errors": 0, "fallbacks": 0, "cache_hits": 0, "bytes": 0})
+            ms = span.duration * 1000
+            row["calls"] += 1
+            row["total_ms"] = round(row["total_ms"] + ms, 1)
+            row["max_ms"] = round(max(row["max_ms"], ms), 1)
+            row["errors"] += span.status == "error"
+            row["fallbacks"] += span.status == "fallback"
+            row["cache_hits"] += bool(span.attrs.get("cache_hit"))
+            row["bytes"] += sum(v for k, v in span.attrs.items() if k.endswith("_bytes") and isinstance(v, int))
+        return list(rows.values())
+
+
+class _Registry:
+    """Process-wide totals per stage, exposed by the metrics endpoint."""
+
+    def __init__(self):
+        self._stages: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            stage = self._stages.setdefault(span.name, {"count": 0, "seconds": 0.0, "max_seconds": 0.0,
+                                                         "errors": 0, "fallbacks": 0, "cache_hits": 0})
+            stage["count"] += 1
+            stage["seconds"] += span.duration
+            stage["max_seconds"] = max(stage["max_seconds"], span.duration)
+            stage["errors"] += span.status == "error"
+            stage["fallbacks"] += span.status == "fallback"
+            stage["cache_hits"] += bool(span.attrs.get("cache_hit"))
+            for key, value in span.attrs.items():
+                if key.endswith("_bytes") and isinstance(value, int):
+                    stage[key] = stage.get(key, 0) + value
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {name: dict(stage) for name, stage in self._stages.items()}
+
+    def prometheus(self) -> str:
+        lines = []
+        for name, stage in sorted(self.snapshot().items()):
+            label = f'stage="{name}"'
+            lines.append(f"postgen_stage_duration_seconds_sum{{{label}}} {stage['seconds']:.6f}")
+            lines.append(f"postgen_stage_duration_seconds_count{{{label}}} {stage['count']}")
+            lines.append(f"postgen_stage_duration_seconds_max{{{label}}} {stage['max_seconds']:.6f}")
+            for counter in ("errors", "fallbacks", "cache_hits"):
+                lines.append(f"postgen_stage_{counter}_total{{{label}}} {stage[counter]}")
+            for key in sorted(k for k in stage if k.endswith("_bytes")):
+                lines.append(f'postgen_stage_bytes_total{{{label},kind="{key[:-len("_bytes")]}"}} {stage[key]}')
+        return "\n".join(lines) + "\n"
+
+
+registry = _Registry()
+
+
+def _write_log(record: Dict[str, Any]):
+    if not METRICS_LOG:
+        return
+    line = json.dumps(record, default=str, ensure_ascii=False)
+    with _log_lock:
+        try:
+            directory = os.path.dirname(METRICS_LOG)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            if os.path.exists(METRICS_LOG) and os.path.getsize(METRICS_LOG) > METRICS_LOG_MAX_BYTES:
+                os.replace(METRICS_LOG, f"{METRICS_LOG}.1")
+            with open(METRICS_LOG, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            print(f"Could not write metrics log: {e}")
+
+
+def _record(span: Span):
+    registry.add(span)
+    if span.run is not None:
+        span.run.add(span)
+    _write_log(span.as_dict())
+
+
+def start_span(name: str, **attrs) -> Span:
+    """Start a span without making it current; for generators, where a context manager would leak across yields."""
+    return Span(name, **attrs)
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[Span]:
+    """Time the enclosed block as stage `name`; exceptions mark the span as an error and propagate."""
+    current = Span(name, **attrs)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.finish(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.finish()
+
+
+def instrument(name: str) -> Callable:
+    """Decorator form of `span`."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def annotate(**attrs):
+    """Attach attributes (e.g. cache_hit, fallback, response_bytes) to the current span, if any."""
+    current = _current_span.get()
+    if current is not None:
+        current.set(**attrs)
+
+
+def fail(message: str):
+    """Mark the current span as failed without raising, for stages that report errors by return value."""
+    current = _current_span.get()
+    if current is not None:
+        current.fail(message)
+
+
+@contextmanager
+def collect_run(label: Optional[str] = None) -> Iterator[RunMetrics]:
+    """Collect every span finished in this context (and in threads started via `submit`) into one run."""
+    run = RunMetrics(label)
+    token = _current_run.set(run)
+    try:
+        yield run
+    finally:
+        _current_run.reset(token)
+        run.wall_time = time.perf_counter() - run.started
+
+
+def submit(executor, fn, *args, **kwargs):
+    """`executor.submit` that runs `fn` in a copy of the caller's context, so spans reach the current run."""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def _metrics_body(path: str) -> Optional[Tuple[bytes, str]]:
+    if path == "/metrics":
+        return registry.prometheus().encode(), "text/plain; version=0.0.4"
+    if path == "/metrics.json":
+        return json.dumps(registry.snapshot()).encode(), "application/json"
+    return None
+
+
+def start_metrics_server(port: int = METRICS_PORT):
+    """Serve /metrics on localhost:`port` from a daemon thread; no-op when port is 0 or already serving.
+
+    http.server is imported here, so processes that never serve metrics don't pay for it.
+    """
+    global _server
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+            class _MetricsHandler(BaseHTTPRequestHandler):
+                def log_message(self, *args):
+                    pass
+
+                def do_GET(self):
+                    body = _metrics_body(self.path)
+                    if body is None:
+                        self.send_error(404)
+                        return
+                    self.send_response(200)
+                    self.send_header("Content-Type", body[1])
+                    self.send_header("Content-Length", str(len(body[0])))
+                    self.end_headers()
+                    self.wfile.write(body[0])
+
+            try:
+                _server = ThreadingHTTPServer(("127.0.0.1", port), _MetricsHandler)
+            except OSError as e:
+                print(f"Metrics endpoint not started on port {port}: {e}")
+                return None
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+            print(f"Metrics available at http://127.0.0.1:{port}/metrics")
+    return _server
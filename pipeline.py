@@ -0,0 +1,134 @@
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from huggingface_api import generate_image_from_context, resolve_engine
+from img_overlay import export_post_image, render_post_image, write_text_on_image
+import metrics
+from settings import get_settings
+
+# Maximum number of HuggingFace inference requests allowed in flight at once
+IMAGE_MAX_CONCURRENCY = get_settings().image_max_concurrency
+
+
+def _generate_background(context: Dict, post: str, index: int, inference_slots=None, cache_policy: Optional[str] = None,
+                         engine: Optional[str] = None):
+    # Local renders don't touch the API, so they don't queue for an inference slot
+    if inference_slots is None or resolve_engine(engine) == "local":
+        return generate_image_from_context(context, post_text=post, variant_index=index, cache_policy=cache_policy, engine=engine)
+    queued = time.perf_counter()
+    with inference_slots:
+        # Time spent waiting for an inference slot shows up on the post_image span
+        metrics.annotate(slot_wait_ms=round((time.perf_counter() - queued) * 1000, 1))
+        return generate_image_from_context(context, post_text=post, variant_index=index, cache_policy=cache_policy, engine=engine)
+
+
+@metrics.instrument("post_image")
+def render_post(context: Dict, post: str, index: int, output_path: Optional[str] = None, inference_slots=None, cache_policy: Optional[str] = None,
+                engine: Optional[str] = None) -> str:
+    """Generate a background for one post and overlay its text; returns the PNG path.
+
+    `inference_slots` is an optional context manager (e.g. a semaphore) held only
+    around the HuggingFace call, so overlays never wait on other posts' inference.
+    `cache_policy` and `engine` are passed through to `generate_image_from_context`.
+    """
+    img = _generate_background(context, post, index, inference_slots, cache_policy, engine)
+    if output_path is None:
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as tmpfile:
+            output_path = tmpfile.name
+    return write_text_on_image(
+        img,
+        post,
+        output_path=output_path,
+        is_holiday=bool(context.get("is_holiday")),
+        style_variant=index
+    )
+
+
+@metrics.instrument("post_image")
+def render_post_exports(context: Dict, post: str, index: int, inference_slots=None, cache_policy: Optional[str] = None,
+                        targets: Sequence[str] = ("square", "portrait", "story", "preview"), fmt: str = "PNG",
+                        engine: Optional[str] = None) -> Dict:
+    """Like `render_post`, but renders once and returns in-memory exports (see `export_post_image`)."""
+    img = _generate_background(context, post, index, inference_slots, cache_policy, engine)
+    rendered = render_post_image(img, post, is_holiday=bool(context.get("is_holiday")), style_variant=index)
+    return export_post_image(rendered, targets=tuple(targets), fmt=fmt)
+
+
+class ImagePipeline:
+    """Renders post images concurrently: backgrounds fan out, overlays follow as each one lands.
+
+    Every post runs in its own worker so the overlay for a post starts as soon as its
+    background arrives; a semaphore caps how many SDXL requests are in flight at once.
+    Pass `inference_slots` to share that cap with other pipelines running at the same time.
+    Failures are captured per post and never cancel the others.
+    """
+
+    def __init__(self, context: Dict, max_inflight: Optional[int] = None, max_workers: Optional[int] = None,
+                 cache_policy: Optional[str] = None, export_targets: Optional[Sequence[str]] = None, export_format: str = "PNG",
+                 engine: Optional[str] = None, inference_slots=None):
+        self.context = context
+        self.cache_policy = cache_policy
+        self.engine = engine
+        # With export targets set, results are {target: ExportedImage} dicts instead of PNG paths
+        self.export_targets = export_targets
+        self.export_format = export_format
+        self.max_inflight = max(1, max_inflight or IMAGE_MAX_CONCURRENCY)
+        self._inference_slots = inference_slots or threading.BoundedSemaphore(self.max_inflight)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or self.max_inflight + 2)
+        self._futures = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def submit(self, index: int, post: str):
+        """Queue a post for rendering; `index` selects its style variant."""
+        if self.export_targets:
+            future = metrics.submit(
+                self._executor, render_post_exports, self.context, post, index, inference_slots=self._inference_slots,
+                cache_policy=self.cache_policy, targets=self.export_targets, fmt=self.export_format, engine=self.engine,
+            )
+        else:
+            future = metrics.submit(self._executor, render_post, self.context, post, index, inference_slots=self._inference_slots,
+                                    cache_policy=self.cache_policy, engine=self.engine)
+        self._futures[future] = index
+        return future
+
+    def _result(self, future):
+        index = self._futures.pop(future)
+        try:
+            return index, future.result(), None
+        except Exception as e:
+            return index, None, e
+
+    def done(self) -> Iterator[Tuple[int, Any, Optional[Exception]]]:
+        """Yield results for posts that have already finished, without waiting for the rest."""
+        for future in [f for f in self._futures if f.done()]:
+            yield self._result(future)
+
+    def completed(self) -> Iterator[Tuple[int, Any, Optional[Exception]]]:
+        """Yield (index, result, error) for each submitted post in completion order.
+
+        `result` is the PNG path, or the exports dict when export targets are set.
+        """
+        for future in as_completed(list(self._futures)):
+            yield self._result(future)
+
+
+def render_post_images(context: Dict, posts: List[str], max_inflight: Optional[int] = None, cache_policy: Optional[str] = None,
+                       export_targets: Optional[Sequence[str]] = None, export_format: str = "PNG",
+                       engine: Optional[str] = None, inference_slots=None) -> Iterator[Tuple[int, Any, Optional[Exception]]]:
+    """Render all posts concurrently, yielding (index, result, error) as each completes."""
+    with ImagePipeline(context, max_inflight=max_inflight, cache_policy=cache_policy, export_targets=export_targets,
+                       export_format=export_format, engine=engine, inference_slots=inference_slots) as pipeline:
+        for i, post in enumerate(posts):
+            pipeline.submit(i, post)
+        yield from pipeline.completed()
@@ -0,0 +1,165 @@
+import functools
+import hashlib
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from disk_cache import CACHE_DIR, open_sqlite
+from settings import get_settings
+
+# Posts at or above this Jaccard similarity (over word pairs) count as repeats; 0 disables the check
+POST_DEDUP_THRESHOLD = get_settings().post_dedup_threshold
+
+SHINGLE_SIZE = 2
+# 20 bands of 3 rows: pairs at Jaccard 0.5 share a bucket ~93% of the time, pairs at 0.1 ~2%
+LSH_BANDS = 20
+LSH_ROWS = 3
+
+_WORD = re.compile(r"[a-z0-9']+")
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240229)
+# Fixed seed: signatures must match across processes and restarts
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(LSH_BANDS * LSH_ROWS)]
+
+
+def _hash64(value: bytes) -> int:
+    # Signed, so it fits an SQLite INTEGER
+    return int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), "little", signed=True)
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> Set[int]:
+    """Hashed word n-grams of `text`, ignoring case and punctuation."""
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return {_hash64(" ".join(words).encode())} if words else set()
+    return {_hash64(" ".join(words[i:i + size]).encode()) for i in range(len(words) - size + 1)}
+
+
+def minhash(shingle_set: Set[int]) -> List[int]:
+    """MinHash signature: the minimum of each fixed random permutation over the shingles."""
+    return [min((a * h + b) % _PRIME for h in shingle_set) for a, b in _PERMUTATIONS]
+
+
+def lsh_buckets(signature: Sequence[int]) -> List[int]:
+    """One bucket id per band; near-duplicates share at least one bucket with high probability."""
+    # Signature values are below 2**61, so they pack as signed 64-bit
+    return [_hash64(array("q", [band, *signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]]).tobytes()) for band in range(LSH_BANDS)]
+
+
+def jaccard(a: Set[int], b: Set[int]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class PostHistory:
+    """Persistent record of generated posts with MinHash/LSH near-duplicate lookup.
+
+    Each post's word-pair shingles are MinHashed and split into LSH bands; the band
+    buckets are indexed in SQLite, so a lookup is a handful of index probes plus an
+    exact Jaccard check on the few candidates, however many posts are stored. Works
+    across processes (app, scheduler, batch CLI) since everything lives in one file.
+    """
+
+    def __init__(self, path: Optional[str] = None, threshold: float = POST_DEDUP_THRESHOLD):
+        self.path = path or os.path.join(CACHE_DIR, "post_history.sqlite3")
+        self.threshold = threshold
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS posts ("
+                "id INTEGER PRIMARY KEY, niche TEXT, day TEXT, text TEXT NOT NULL, shingles BLOB NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (bucket INTEGER NOT NULL, post_id INTEGER NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS buckets_bucket ON buckets (bucket)")
+            conn.execute("CREATE INDEX IF NOT EXISTS posts_niche ON posts (niche, id)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # One connection per thread: opening a connection costs more than the lookup itself
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = open_sqlite(self.path)
+        with conn:
+            yield conn
+
+    def __len__(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM posts").fetchone()[0]
+
+    def _candidates(self, conn: sqlite3.Connection, buckets: List[int]) -> Iterator[Tuple[int, str, Set[int]]]:
+        rows = conn.execute(
+            f"SELECT id, text, shingles FROM posts WHERE id IN "
+            f"(SELECT post_id FROM buckets WHERE bucket IN ({','.join('?' * len(buckets))}))",
+            buckets,
+        )
+        for post_id, text, blob in rows:
+            yield post_id, text, set(array("q", blob))
+
+    def find_similar(self, text: str) -> Optional[Tuple[str, float]]:
+        """Return (stored text, similarity) of the closest stored post at or above the threshold, else None."""
+        if self.threshold <= 0:
+            return None
+        shingle_set = shingles(text)
+        if not shingle_set:
+            return None
+        best = None
+        with self._connect() as conn:
+            for _, stored, stored_shingles in self._candidates(conn, lsh_buckets(minhash(shingle_set))):
+                similarity = jaccard(shingle_set, stored_shingles)
+                if similarity >= self.threshold and (best is None or similarity > best[1]):
+                    best = (stored, similarity)
+        return best
+
+    def is_duplicate(self, text: str) -> bool:
+        return self.find_similar(text) is not None
+
+    def filter_new(self, candidates: Iterable[str], accepted: Sequence[str] = ()) -> List[str]:
+        """Candidates that repeat neither a stored post, an `accepted` post, nor an earlier candidate."""
+        kept: List[str] = []
+        seen = [shingles(post) for post in accepted]
+        for post in candidates:
+            shingle_set = shingles(post)
+            if self.threshold > 0 and any(jaccard(shingle_set, other) >= self.threshold for other in seen):
+                continue
+            if self.is_duplicate(post):
+                continue
+            kept.append(post)
+            seen.append(shingle_set)
+        return kept
+
+    def add(self, posts: Iterable[str], niche: Optional[str] = None, day: Optional[str] = None):
+        """Record posts as used so later generations avoid them."""
+        now = time.time()
+        with self._connect() as conn:
+            for post in posts:
+                shingle_set = shingles(post)
+                if not shingle_set:
+                    continue
+                cursor = conn.execute(
+                    "INSERT INTO posts (niche, day, text, shingles, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (niche, day, post, array("q", sorted(shingle_set)).tobytes(), now),
+                )
+                conn.executemany(
+                    "INSERT INTO buckets (bucket, post_id) VALUES (?, ?)",
+                    [(bucket, cursor.lastrowid) for bucket in lsh_buckets(minhash(shingle_set))],
+                )
+
+    def recent(self, niche: str, limit: int = 8) -> List[str]:
+        """The latest stored posts for a niche, newest first; handy as a "don't repeat these" prompt hint."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT text FROM posts WHERE niche = ? ORDER BY id DESC LIMIT ?", (niche, limit)).fetchall()
+        return [row[0] for row in rows]
+
+
+@functools.lru_cache(maxsize=None)
+def post_history() -> PostHistory:
+    """Process-wide post history under CACHE_DIR."""
+    return PostHistory()
@@ -0,0 +1,80 @@
+import datetime
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Dict, List, Optional
+
+from disk_cache import CACHE_DIR
+
+READY_DIR = os.path.join(CACHE_DIR, "ready")
+_lock = threading.Lock()
+
+
+def _entry_dir(niche: str, day: str) -> str:
+    return os.path.join(READY_DIR, day, niche.replace(" ", "_").lower())
+
+
+def put_ready(context: Dict, posts: List[str], image_paths: List[Optional[str]]) -> str:
+    """Store pre-generated posts and copies of their images for (niche, date); returns the entry directory."""
+    entry_dir = _entry_dir(context["niche"], context["date"])
+    tmp_dir = f"{entry_dir}.tmp{threading.get_ident()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    stored = []
+    for i, (post, path) in enumerate(zip(posts, image_paths)):
+        image = None
+        if path and os.path.exists(path):
+            image = f"post_{i + 1}.png"
+            shutil.copyfile(path, os.path.join(tmp_dir, image))
+        stored.append({"text": post, "image": image})
+    with open(os.path.join(tmp_dir, "entry.json"), "w", encoding="utf-8") as f:
+        json.dump({"context": context, "posts": stored, "created_at": time.time(), "served": False}, f, ensure_ascii=False)
+    with _lock:
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+        os.replace(tmp_dir, entry_dir)
+    return entry_dir
+
+
+def take_ready(niche: str, day: datetime.date) -> Optional[Dict]:
+    """Return unserved pre-generated posts for (niche, date) and mark them served.
+
+    The result has the stored `context` and `posts` as [{"text", "image"}] with absolute
+    image paths (None where the image failed). Returns None when nothing is ready.
+    """
+    entry_dir = _entry_dir(niche, day.isoformat())
+    entry_path = os.path.join(entry_dir, "entry.json")
+    with _lock:
+        if not os.path.exists(entry_path):
+            return None
+        with open(entry_path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+        if entry.get("served"):
+            return None
+        entry["served"] = True
+        with open(entry_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+    for post in entry["posts"]:
+        if post.get("image"):
+            post["image"] = os.path.join(entry_dir, post["image"])
+    return entry
+
+
+def has_ready(niche: str, day: datetime.date) -> bool:
+    entry_path = os.path.join(_entry_dir(niche, day.isoformat()), "entry.json")
+    if not os.path.exists(entry_path):
+        return False
+    with open(entry_path, "r", encoding="utf-8") as f:
+        return not json.load(f).get("served")
+
+
+def prune_ready(keep_days: int = 7):
+    """Delete ready-queue entries for dates more than `keep_days` in the past."""
+    if not os.path.isdir(READY_DIR):
+        return
+    cutoff = (datetime.date.today() - datetime.timedelta(days=keep_days)).isoformat()
+    for day in os.listdir(READY_DIR):
+        if day < cutoff:
+            shutil.rmtree(os.path.join(READY_DIR, day), ignore_errors=True)
@@ -1,34 +1,29 @@
-import time
 import datetime
-import requests
-import os
-from dotenv import load_dotenv
 
-# Load Slack webhook from .env
-load_dotenv()
-slack_url = os.getenv("SLACK_WEBHOOK_URL")
+import http_client
+from settings import get_settings
+from slack_outbox import slack_outbox
 
-if not slack_url:
-    raise ValueError("SLACK_WEBHOOK_URL environment variable not set")
 
 def send_reminder():
+    slack_url = get_settings().slack_webhook_url
+    if not slack_url:
+        print("SLACK_WEBHOOK_URL environment variable not set; reminder not sent.")
+        return
+    midnight = datetime.datetime.combine(datetime.date.today(), datetime.time())
+    if slack_outbox().has_delivery_since(midnight.timestamp()):
+        print("Posts already sent to Slack today; reminder not needed.")
+        return
     message = {"text": "Reminder: You haven’t generated today’s post yet!"}
-    response = requests.post(slack_url, json=message)
+    response = http_client.post(slack_url, json=message, timeout=10)
     if response.status_code == 200:
         print("Reminder sent!")
     else:
         print(f"Failed to send reminder: {response.status_code} {response.text}")
 
-# User declares reminder time here (hour and minute)
-reminder_hour = 14
-reminder_minute = 19
 
-already_sent = False
-
-while not already_sent:
-    now = datetime.datetime.now()
-    # print(f"Checking time: {now.hour}:{now.minute}")
-    if now.hour == reminder_hour and now.minute == reminder_minute:
-        send_reminder()
-        already_sent = True
-    time.sleep(30) # Check every 30 seconds
+if __name__ == "__main__":
+    # The reminder is now one job of the scheduler daemon; this keeps `python reminder.py` working.
+    # Set REMINDER_AT (HH:MM, 24-hour) to change the time.
+    from scheduler import main
+    main(["--jobs", "reminder"])
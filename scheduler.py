@@ -0,0 +1,131 @@
+"""Background scheduler daemon: warms caches, pre-generates today's posts and sends the reminder.
+
+Jobs run once a day at configurable times (24-hour HH:MM, local time):
+    WARM_AT          holidays and trending news for every niche   (default 06:00)
+    PREGENERATE_AT   post text and images into the ready queue    (default 06:30)
+    REMINDER_AT      Slack reminder                                (default 14:19)
+PREGENERATE_NICHES is a comma-separated subset of niches (default: all).
+While running, it also drains the Slack outbox, so deliveries queued by an app
+session that has since stopped still go out.
+
+Run:
+    python scheduler.py                 # run all jobs on schedule
+    python scheduler.py --run-now warm  # run one job immediately and exit
+"""
+import argparse
+import datetime
+import os
+import sched
+import time
+from typing import Callable, Dict, List
+
+from content_api import LEGAL_NICHES, RequestContext, fetch_trending_article, get_post_ideas_batch, uae_holiday_store
+from metrics import start_metrics_server
+from pipeline import render_post_images
+from ready_queue import has_ready, prune_ready, put_ready
+from reminder import send_reminder
+from settings import get_settings
+from slack_outbox import slack_outbox
+
+WARM_AT = get_settings().warm_at
+PREGENERATE_AT = get_settings().pregenerate_at
+REMINDER_AT = get_settings().reminder_at
+PREGENERATE_NICHES = list(get_settings().pregenerate_niches) or LEGAL_NICHES
+PREGENERATE_NUM_POSTS = get_settings().pregenerate_num_posts
+
+
+def warm_caches(niches: List[str] = PREGENERATE_NICHES):
+    """Load this year's and next year's holidays and today's headline for each niche."""
+    uae_holiday_store().warm(background=False)
+    today = datetime.date.today()
+    for niche in niches:
+        fetch_trending_article(niche, today)
+    print(f"Warmed holidays and news for {len(niches)} niches.")
+
+
+def pregenerate_posts(niches: List[str] = PREGENERATE_NICHES, num_posts: int = PREGENERATE_NUM_POSTS):
+    """Generate today's posts and images for each niche and store them in the ready queue."""
+    today = datetime.date.today()
+    niches = [niche for niche in niches if not has_ready(niche, today)]
+    if not niches:
+        return
+    contexts = [RequestContext(niche, date_override=today).resolve() for niche in niches]
+    results = get_post_ideas_batch(contexts, num_posts=num_posts)
+    for context, posts in zip(contexts, results):
+        if isinstance(posts, dict):
+            print(f"Pre-generation failed for {context['niche']}: {posts.get('error')}")
+            continue
+        image_paths = [None] * len(posts)
+        for i, img_path, error in render_post_images(context, posts):
+            if error is not None:
+                print(f"Pre-generated image {i + 1} failed for {context['niche']}: {error}")
+            image_paths[i] = img_path
+        put_ready(context, posts, image_paths)
+        for path in image_paths:
+            if path:
+                os.remove(path)
+        print(f"Pre-generated {len(posts)} posts for {context['niche']}.")
+    prune_ready()
+
+
+JOBS: Dict[str, Callable[[], None]] = {
+    "warm": warm_caches,
+    "pregenerate": pregenerate_posts,
+    "reminder": send_reminder,
+}
+
+
+def _parse_time(value: str) -> datetime.time:
+    hour, minute = value.split(":")
+    return datetime.time(int(hour), int(minute))
+
+
+def _next_run(at: datetime.time, now: datetime.datetime) -> datetime.datetime:
+    run = datetime.datetime.combine(now.date(), at)
+    if run <= now:
+        run += datetime.timedelta(days=1)
+    return run
+
+
+class DailyScheduler:
+    """Runs jobs at fixed local times every day; sleeps until the next job instead of polling."""
+
+    def __init__(self):
+        self._scheduler = sched.scheduler(time.time, time.sleep)
+
+    def add(self, name: str, at: datetime.time, job: Callable[[], None]):
+        run_at = _next_run(at, datetime.datetime.now())
+        self._scheduler.enterabs(run_at.timestamp(), 0, self._run, (name, at, job))
+        print(f"Scheduled {name} for {run_at:%Y-%m-%d %H:%M}.")
+
+    def _run(self, name: str, at: datetime.time, job: Callable[[], None]):
+        try:
+            job()
+        except Exception as e:
+            print(f"Job {name} failed: {e}")
+        self.add(name, at, job)
+
+    def run_forever(self):
+        self._scheduler.run()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Warm caches, pre-generate posts and send reminders on a daily schedule.")
+    parser.add_argument("--run-now", choices=sorted(JOBS), help="Run one job immediately and exit")
+    parser.add_argument("--jobs", nargs="+", choices=sorted(JOBS), default=sorted(JOBS), help="Jobs to schedule (default: all)")
+    args = parser.parse_args(argv)
+
+    if args.run_now:
+        JOBS[args.run_now]()
+        return
+    start_metrics_server()
+    slack_outbox().start_sender()
+    times = {"warm": WARM_AT, "pregenerate": PREGENERATE_AT, "reminder": REMINDER_AT}
+    scheduler = DailyScheduler()
+    for name in args.jobs:
+        scheduler.add(name, _parse_time(times[name]), JOBS[name])
+    scheduler.run_forever()
+
+
+if __name__ == "__main__":
+    main()
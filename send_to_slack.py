@@ -1,26 +1,156 @@
-import requests
-import os
-from dotenv import load_dotenv
+import http_client
+import json
+import metrics
+from typing import Dict, List, Optional, Sequence, Tuple
+from settings import get_settings
 
-load_dotenv()
+# Slack error codes worth retrying; anything else (bad token, unknown channel, ...) fails for good
+_RETRYABLE_ERRORS = {"ratelimited", "internal_error", "fatal_error", "service_unavailable", "request_timeout"}
 
-def send_post_to_slack(message):
-    webhook_url = os.getenv("SLACK_WEBHOOK_URL")
-    if not webhook_url:
-        print("Slack webhook not set.")
+
+class SlackDeliveryError(RuntimeError):
+    """A failed Slack call; `retryable` says whether sending again may succeed."""
+
+    def __init__(self, message: str, retryable: bool = True, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+def format_slack_message(posts, context=None):
+    """Combine posts into a numbered Slack message, headed by the run's niche and date."""
+    body = "\n\n".join([f"{i+1}. {post}" for i, post in enumerate(posts)])
+    if not context:
+        return body
+    header = f"*{context.get('niche')}* posts for {context.get('date')}"
+    if context.get("is_holiday"):
+        header += f" ({context.get('holiday_name')})"
+    elif context.get("trending"):
+        header += f"\nTrending: {context.get('trending')}"
+    return f"{header}\n\n{body}"
+
+
+def format_slack_blocks(posts, context=None) -> List[Dict]:
+    """Block Kit layout for a run: one header section, then one section per post."""
+    blocks = []
+    if context:
+        header = f"*{context.get('niche')}* posts for {context.get('date')}"
+        if context.get("is_holiday"):
+            header += f" ({context.get('holiday_name')})"
+        elif context.get("trending"):
+            trending = context.get("trending")
+            if context.get("trending_url"):
+                trending = f"<{context['trending_url']}|{trending}>"
+            header += f"\nTrending: {trending}"
+        blocks += [{"type": "section", "text": {"type": "mrkdwn", "text": header}}, {"type": "divider"}]
+    for i, post in enumerate(posts):
+        blocks.append({"type": "section", "text": {"type": "mrkdwn", "text": f"*{i+1}.* {post}"}})
+    return blocks
+
+
+def _transport_error(what: str, error: Exception, resend_safe: bool = False) -> SlackDeliveryError:
+    """SlackDeliveryError for a request that got no response.
+
+    Retryable only if the request never reached Slack (or sending it twice is harmless):
+    after a read timeout or a dropped connection Slack may already have posted the message,
+    and a retry would post it again.
+    """
+    import requests
+
+    if resend_safe or http_client.never_sent(error):
+        return SlackDeliveryError(f"{what}: {error}")
+    if isinstance(error, (requests.Timeout, requests.ConnectionError)):
+        return SlackDeliveryError(f"{what}: outcome unknown, not retried to avoid a duplicate ({error})", retryable=False)
+    return SlackDeliveryError(f"{what}: {error}", retryable=False)
+
+
+def _check_http(response, what: str):
+    if response.status_code == 200:
         return
+    retryable = response.status_code == 429 or response.status_code >= 500
+    raise SlackDeliveryError(f"{what}: HTTP {response.status_code} {response.text[:200]}", retryable, http_client.retry_after_seconds(response))
 
-    payload = {"text": message}
+
+def post_webhook(text: str, blocks: Optional[List[Dict]] = None):
+    """Send one message through the incoming webhook; raises SlackDeliveryError on failure."""
+    webhook_url = get_settings().slack_webhook_url
+    if not webhook_url:
+        raise SlackDeliveryError("SLACK_WEBHOOK_URL is not set", retryable=False)
+    payload = {"text": text}
+    if blocks:
+        payload["blocks"] = blocks
     try:
-        response = requests.post(webhook_url, json=payload)
-        if response.status_code == 200:
-            print("Post sent to Slack.")
-        
-            with open("post_sent.txt", "w") as f:
-                f.write("true")
-            return True
-        else:
-            print("Failed to send post to Slack.")
-            return False
+        # The outbox schedules its own retries, so don't stack http_client's on top
+        response = http_client.post(webhook_url, json=payload, timeout=10, retries=0)
     except Exception as e:
-        print("Error sending post:", e)
+        raise _transport_error("Slack webhook", e) from e
+    metrics.annotate(status_code=response.status_code, request_bytes=len(json.dumps(payload).encode()))
+    _check_http(response, "Slack webhook")
+
+
+def call_slack_api(method: str, *, json_body: Optional[Dict] = None, data: Optional[Dict] = None, resend_safe: bool = False) -> Dict:
+    """Call a Slack Web API method with the bot token; returns the response body or raises SlackDeliveryError.
+
+    Pass `resend_safe` for methods with no visible effect, so a call that may have reached Slack is still retried.
+    """
+    settings = get_settings()
+    headers = {"Authorization": f"Bearer {settings.slack_bot_token}"}
+    try:
+        response = http_client.post(f"{settings.slack_api_base}/{method}", headers=headers, json=json_body, data=data, timeout=15, retries=0)
+    except Exception as e:
+        raise _transport_error(f"Slack {method}", e, resend_safe) from e
+    _check_http(response, f"Slack {method}")
+    body = response.json()
+    if not body.get("ok"):
+        error = body.get("error", "unknown_error")
+        raise SlackDeliveryError(f"Slack {method}: {error}", error in _RETRYABLE_ERRORS, http_client.retry_after_seconds(response))
+    return body
+
+
+def post_message(text: str, blocks: Optional[List[Dict]] = None) -> str:
+    """Post a message to SLACK_CHANNEL_ID as the bot; returns its timestamp (message id)."""
+    message = {"channel": get_settings().slack_channel_id, "text": text, "unfurl_links": False}
+    if blocks:
+        message["blocks"] = blocks
+    return call_slack_api("chat.postMessage", json_body=message)["ts"]
+
+
+def upload_images(images: Sequence[Tuple[str, bytes]], thread_ts: Optional[str] = None) -> List[str]:
+    """Upload (filename, data) images and share them in the channel, threaded under `thread_ts`.
+
+    Uses the external upload flow: one upload URL per file, then a single
+    completeUploadExternal call that shares all of them together. Returns the file ids.
+    """
+    files = []
+    for filename, data in images:
+        # A retry starts from a new upload URL, so only completeUploadExternal (which shares the files) can duplicate anything
+        ticket = call_slack_api("files.getUploadURLExternal", data={"filename": filename, "length": len(data)}, resend_safe=True)
+        try:
+            response = http_client.post(ticket["upload_url"], data=data, timeout=60, retries=0)
+        except Exception as e:
+            raise _transport_error(f"Slack upload of {filename}", e, resend_safe=True) from e
+        _check_http(response, f"Slack upload of {filename}")
+        files.append({"id": ticket["file_id"], "title": filename})
+    if files:
+        completion = {"files": json.dumps(files), "channel_id": get_settings().slack_channel_id}
+        if thread_ts:
+            completion["thread_ts"] = thread_ts
+        call_slack_api("files.completeUploadExternal", data=completion)
+    metrics.annotate(images=len(files), upload_bytes=sum(len(data) for _, data in images))
+    return [f["id"] for f in files]
+
+
+@metrics.instrument("slack_send")
+def send_post_to_slack(message):
+    """Send a text message through the webhook right away; returns True on success.
+
+    Prefer `slack_outbox.queue_posts`, which returns immediately and retries in the background.
+    """
+    try:
+        post_webhook(message)
+    except SlackDeliveryError as e:
+        print(f"Failed to send post to Slack: {e}")
+        metrics.fail(str(e))
+        return False
+    print("Post sent to Slack.")
+    return True
@@ -0,0 +1,132 @@
+"""Application configuration, read once from the environment (and .env) into a cached object.
+
+Real environment variables take precedence over .env. Modules keep their familiar
+constants (e.g. `http_client.HTTP_READ_TIMEOUT`) but source them from `get_settings()`,
+so .env is parsed exactly once per process however many modules are imported.
+"""
+import functools
+import os
+from typing import NamedTuple, Optional, Tuple
+
+
+class Settings(NamedTuple):
+    # API keys and endpoints
+    openrouter_api_key: Optional[str]
+    openrouter_api_base: str
+    openrouter_model: str
+    huggingface_api_key: Optional[str]
+    huggingface_api_url: str
+    nager_api_base: str
+    slack_webhook_url: Optional[str]
+    slack_bot_token: Optional[str]
+    slack_channel_id: Optional[str]
+    slack_api_base: str
+    # Outbound HTTP
+    http_connect_timeout: float
+    http_read_timeout: float
+    http_max_retries: int
+    http_pool_size: int
+    # Circuit breakers and latency budgets (seconds)
+    circuit_failure_threshold: int
+    circuit_cooldown: float
+    openrouter_budget: float
+    huggingface_budget: float
+    gnews_budget: float
+    nager_budget: float
+    generation_deadline: float
+    # Caches
+    cache_dir: str
+    news_cache_ttl: int
+    news_cache_max_entries: int
+    holiday_cache_ttl: int
+    holiday_retry_base: float
+    holiday_retry_max: float
+    background_cache_policy: str
+    background_cache_max_bytes: int
+    image_engine: str
+    # Generation
+    llm_batch_size: int
+    image_max_concurrency: int
+    post_dedup_threshold: float
+    post_dedup_extra: int
+    job_workers: int
+    job_result_ttl: float
+    # Slack delivery
+    slack_max_attempts: int
+    slack_retry_base: float
+    slack_retry_max: float
+    # Metrics
+    metrics_log: str
+    metrics_log_max_bytes: int
+    metrics_port: int
+    # Scheduler
+    warm_at: str
+    pregenerate_at: str
+    reminder_at: str
+    pregenerate_niches: Tuple[str, ...]
+    pregenerate_num_posts: int
+
+
+def _load_dotenv():
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        return
+    load_dotenv()
+
+
+@functools.lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """Load .env and read every setting; later calls return the same object."""
+    _load_dotenv()
+    env = os.getenv
+    cache_dir = env("CACHE_DIR", ".cache")
+    return Settings(
+        openrouter_api_key=env("OPENROUTER_API_KEY"),
+        openrouter_api_base=env("OPENROUTER_API_BASE", "https://openrouter.ai/api/v1"),
+        openrouter_model=env("OPENROUTER_MODEL", "mistralai/mixtral-8x7b-instruct"),  # Default to a good free model
+        huggingface_api_key=env("HUGGINGFACE_API_KEY"),
+        huggingface_api_url=env("HUGGINGFACE_API_URL", "https://api-inference.huggingface.co/models/stabilityai/stable-diffusion-xl-base-1.0"),
+        nager_api_base=env("NAGER_API_BASE", "https://date.nager.at/api/v3"),
+        slack_webhook_url=env("SLACK_WEBHOOK_URL"),
+        slack_bot_token=env("SLACK_BOT_TOKEN"),
+        slack_channel_id=env("SLACK_CHANNEL_ID"),
+        slack_api_base=env("SLACK_API_BASE", "https://slack.com/api"),
+        http_connect_timeout=float(env("HTTP_CONNECT_TIMEOUT", "5")),
+        http_read_timeout=float(env("HTTP_READ_TIMEOUT", "30")),
+        http_max_retries=int(env("HTTP_MAX_RETRIES", "2")),
+        http_pool_size=int(env("HTTP_POOL_SIZE", "10")),
+        circuit_failure_threshold=int(env("CIRCUIT_FAILURE_THRESHOLD", "3")),
+        circuit_cooldown=float(env("CIRCUIT_COOLDOWN", "60")),
+        openrouter_budget=float(env("OPENROUTER_BUDGET", "30")),
+        huggingface_budget=float(env("HUGGINGFACE_BUDGET", "30")),
+        gnews_budget=float(env("GNEWS_BUDGET", "8")),
+        nager_budget=float(env("NAGER_BUDGET", "10")),
+        generation_deadline=float(env("GENERATION_DEADLINE", "60")),
+        cache_dir=cache_dir,
+        news_cache_ttl=int(env("NEWS_CACHE_TTL", "3600")),
+        news_cache_max_entries=int(env("NEWS_CACHE_MAX_ENTRIES", "512")),
+        holiday_cache_ttl=int(env("HOLIDAY_CACHE_TTL", str(7 * 24 * 3600))),
+        holiday_retry_base=float(env("HOLIDAY_RETRY_BASE", "30")),
+        holiday_retry_max=float(env("HOLIDAY_RETRY_MAX", "3600")),
+        background_cache_policy=env("BACKGROUND_CACHE_POLICY", "off"),
+        background_cache_max_bytes=int(env("BACKGROUND_CACHE_MAX_BYTES", str(500 * 1024 * 1024))),
+        image_engine=env("IMAGE_ENGINE", "remote"),
+        llm_batch_size=int(env("LLM_BATCH_SIZE", "6")),
+        image_max_concurrency=int(env("IMAGE_MAX_CONCURRENCY", "2")),
+        post_dedup_threshold=float(env("POST_DEDUP_THRESHOLD", "0.5")),
+        post_dedup_extra=int(env("POST_DEDUP_EXTRA", "1")),
+        job_workers=int(env("JOB_WORKERS", "2")),
+        job_result_ttl=float(env("JOB_RESULT_TTL", "3600")),
+        slack_max_attempts=int(env("SLACK_MAX_ATTEMPTS", "6")),
+        slack_retry_base=float(env("SLACK_RETRY_BASE", "5")),
+        slack_retry_max=float(env("SLACK_RETRY_MAX", "900")),
+        metrics_log=env("METRICS_LOG", os.path.join(cache_dir, "metrics.jsonl")),
+        metrics_log_max_bytes=int(env("METRICS_LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+        metrics_port=int(env("METRICS_PORT", "0")),
+        warm_at=env("WARM_AT", "06:00"),
+        pregenerate_at=env("PREGENERATE_AT", "06:30"),
+        reminder_at=env("REMINDER_AT", "14:19"),
+        pregenerate_niches=tuple(n.strip() for n in env("PREGENERATE_NICHES", "").split(",") if n.strip()),
+        pregenerate_num_posts=int(env("PREGENERATE_NUM_POSTS", "2")),
+    )
@@ -0,0 +1,250 @@
+import functools
+import hashlib
+import json
+import os
+import random
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import metrics
+from disk_cache import CACHE_DIR, connect_sqlite
+from send_to_slack import SlackDeliveryError, format_slack_blocks, format_slack_message, post_message, post_webhook, upload_images
+from settings import get_settings
+
+_settings = get_settings()
+SLACK_MAX_ATTEMPTS = _settings.slack_max_attempts
+SLACK_RETRY_BASE = _settings.slack_retry_base
+SLACK_RETRY_MAX = _settings.slack_retry_max
+
+# A delivery left "sending" this long belongs to a sender that died; it is claimed again
+SENDING_LEASE = 300
+SENDER_POLL_INTERVAL = 30
+
+
+class SlackOutbox:
+    """Durable queue of Slack deliveries, drained by a background sender.
+
+    Each delivery is one run's posts coalesced into a single Block Kit message, plus
+    its rendered images. Rows live in SQLite under CACHE_DIR and images on disk next
+    to it, so queued deliveries survive restarts. The delivery id doubles as an
+    idempotency key: enqueueing the same run again returns the existing delivery
+    instead of posting twice.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.path.join(CACHE_DIR, "slack_outbox.sqlite3")
+        self.files_dir = os.path.join(os.path.dirname(self.path) or ".", "outbox")
+        os.makedirs(self.files_dir, exist_ok=True)
+        self._wake = threading.Event()
+        self._sender = None
+        self._sender_lock = threading.Lock()
+        with connect_sqlite(self.path, sqlite3.Row) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS deliveries ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, niche TEXT, day TEXT, text TEXT NOT NULL, blocks TEXT NOT NULL, "
+                "images TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL NOT NULL, claimed_at REAL, "
+                "message_ts TEXT, last_error TEXT, created_at REAL NOT NULL, sent_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS deliveries_due ON deliveries (status, next_attempt_at)")
+
+    @staticmethod
+    def delivery_key(posts: Sequence[str], context: Optional[Dict] = None) -> str:
+        """Idempotency key for a run: the same niche, date and posts always map to the same delivery."""
+        context = context or {}
+        payload = json.dumps([context.get("niche"), context.get("date"), list(posts)])
+        return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+    def enqueue(self, posts: Sequence[str], context: Optional[Dict] = None,
+                images: Sequence[Tuple[str, bytes]] = (), key: Optional[str] = None) -> str:
+        """Queue one message for `posts` (plus (filename, data) images); returns the delivery id.
+
+        A delivery already queued or sent under the same key is left alone; a failed
+        one is queued again with `images`.
+        """
+        delivery_id = key or self.delivery_key(posts, context)
+        context = context or {}
+        with connect_sqlite(self.path, sqlite3.Row) as conn:
+            row = conn.execute("SELECT status FROM deliveries WHERE id = ?", (delivery_id,)).fetchone()
+            if row is not None:
+                if row["status"] == "failed":
+                    # A failed delivery's image files were removed when it failed
+                    filenames = self._store_images(delivery_id, images)
+                    conn.execute(
+                        "UPDATE deliveries SET status = 'queued', images = ?, attempts = 0, next_attempt_at = ?, last_error = NULL "
+                        "WHERE id = ?",
+                        (json.dumps(filenames), time.time(), delivery_id),
+                    )
+                    self._wake.set()
+                return delivery_id
+            filenames = self._store_images(delivery_id, images)
+            conn.execute(
+                "INSERT INTO deliveries (id, status, niche, day, text, blocks, images, next_attempt_at, created_at) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?, ?, ?)",
+                (delivery_id, context.get("niche"), str(context.get("date") or ""), format_slack_message(posts, context),
+                 json.dumps(format_slack_blocks(posts, context)), json.dumps(filenames), time.time(), time.time()),
+            )
+        self._wake.set()
+        return delivery_id
+
+    def _store_images(self, delivery_id: str, images: Sequence[Tuple[str, bytes]]) -> List[str]:
+        directory = os.path.join(self.files_dir, delivery_id)
+        os.makedirs(directory, exist_ok=True)
+        filenames = []
+        for filename, data in images:
+            filename = os.path.basename(filename)
+            tmp_path = os.path.join(directory, f".{filename}.{uuid.uuid4().hex}")
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, os.path.join(directory, filename))
+            filenames.append(filename)
+        return filenames
+
+    def _load_images(self, delivery_id: str, filenames: List[str]) -> List[Tuple[str, bytes]]:
+        images = []
+        for filename in filenames:
+            with open(os.path.join(self.files_dir, delivery_id, filename), "rb") as f:
+                images.append((filename, f.read()))
+        return images
+
+    def status(self, delivery_id: str) -> Optional[Dict]:
+        """Current state of a delivery: status (queued/sending/sent/failed), attempts, last_error, ..."""
+        with connect_sqlite(self.path, sqlite3.Row) as conn:
+            row = conn.execute(
+                "SELECT id, status, niche, day, attempts, next_attempt_at, message_ts, last_error, created_at, sent_at "
+                "FROM deliveries WHERE id = ?",
+                (delivery_id,),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def recent(self, limit: int = 20) -> List[Dict]:
+        with connect_sqlite(self.path, sqlite3.Row) as conn:
+            rows = conn.execute(
+                "SELECT id, status, niche, day, attempts, last_error, created_at, sent_at FROM deliveries ORDER BY created_at DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def has_delivery_since(self, since: float) -> bool:
+        """Whether any delivery queued at or after `since` (epoch seconds) is sent or still on its way."""
+        with connect_sqlite(self.path, sqlite3.Row) as conn:
+            row = conn.execute("SELECT 1 FROM deliveries WHERE created_at >= ? AND status != 'failed' LIMIT 1", (since,)).fetchone()
+        return row is not None
+
+    def _claim(self, now: float) -> Optional[sqlite3.Row]:
+        # Optimistic claim: a concurrent sender (another process) loses the UPDATE race and moves on
+        with connect_sqlite(self.path, sqlite3.Row) as conn:
+            candidates = conn.execute(
+                "SELECT id FROM deliveries WHERE (status = 'queued' AND next_attempt_at <= ?) "
+                "OR (status = 'sending' AND claimed_at < ?) ORDER BY next_attempt_at LIMIT 10",
+                (now, now - SENDING_LEASE),
+            ).fetchall()
+            for candidate in candidates:
+                claimed = conn.execute(
+                    "UPDATE deliveries SET status = 'sending', claimed_at = ?, attempts = attempts + 1 "
+                    "WHERE id = ? AND ((status = 'queued' AND next_attempt_at <= ?) OR (status = 'sending' AND claimed_at < ?))",
+                    (now, candidate["id"], now, now - SENDING_LEASE),
+                ).rowcount
+                if claimed:
+                    return conn.execute("SELECT * FROM deliveries WHERE id = ?", (candidate["id"],)).fetchone()
+        return None
+
+    def _deliver(self, delivery: sqlite3.Row):
+        settings = get_settings()
+        blocks = json.loads(delivery["blocks"])
+        if not (settings.slack_bot_token and settings.slack_channel_id):
+            # Incoming webhooks can't carry files, so this path is text-only
+            post_webhook(delivery["text"], blocks)
+            return
+        message_ts = delivery["message_ts"]
+        if not message_ts:
+            message_ts = post_message(delivery["text"], blocks)
+            # Remember the message so a retry after a failed upload doesn't post it again
+            with connect_sqlite(self.path, sqlite3.Row) as conn:
+                conn.execute("UPDATE deliveries SET message_ts = ? WHERE id = ?", (message_ts, delivery["id"]))
+        images = self._load_images(delivery["id"], json.loads(delivery["images"]))
+        if images:
+            upload_images(images, thread_ts=message_ts)
+
+    def _finish(self, delivery_id: str, status: str, error: Optional[str] = None, next_attempt_at: Optional[float] = None):
+        with connect_sqlite(self.path, sqlite3.Row) as conn:
+            conn.execute(
+                "UPDATE deliveries SET status = ?, last_error = ?, next_attempt_at = COALESCE(?, next_attempt_at), "
+                "sent_at = CASE WHEN ? = 'sent' THEN ? ELSE sent_at END WHERE id = ?",
+                (status, error, next_attempt_at, status, time.time(), delivery_id),
+            )
+        if status in ("sent", "failed"):
+            shutil.rmtree(os.path.join(self.files_dir, delivery_id), ignore_errors=True)
+
+    def process_due(self) -> int:
+        """Send every delivery that is due; returns how many were attempted."""
+        attempted = 0
+        while True:
+            delivery = self._claim(time.time())
+            if delivery is None:
+                return attempted
+            attempted += 1
+            with metrics.span("slack_send", delivery=delivery["id"], attempt=delivery["attempts"]):
+                try:
+                    self._deliver(delivery)
+                except SlackDeliveryError as e:
+                    metrics.fail(str(e))
+                    if not e.retryable or delivery["attempts"] >= SLACK_MAX_ATTEMPTS:
+                        print(f"Slack delivery {delivery['id']} failed: {e}")
+                        self._finish(delivery["id"], "failed", str(e))
+                        continue
+                    delay = min(SLACK_RETRY_MAX, SLACK_RETRY_BASE * 2 ** (delivery["attempts"] - 1))
+                    delay = max(e.retry_after or 0, delay * random.uniform(0.5, 1.0))
+                    print(f"Slack delivery {delivery['id']} will retry in {delay:.0f}s: {e}")
+                    self._finish(delivery["id"], "queued", str(e), time.time() + delay)
+                    continue
+                except Exception as e:
+                    # Missing image files and the like won't fix themselves
+                    metrics.fail(str(e))
+                    print(f"Slack delivery {delivery['id']} failed: {e}")
+                    self._finish(delivery["id"], "failed", str(e))
+                    continue
+            self._finish(delivery["id"], "sent")
+            print("Post sent to Slack.")
+
+    def _next_due_in(self) -> float:
+        with connect_sqlite(self.path, sqlite3.Row) as conn:
+            row = conn.execute("SELECT MIN(next_attempt_at) FROM deliveries WHERE status = 'queued'").fetchone()
+        if row[0] is None:
+            return SENDER_POLL_INTERVAL
+        return min(SENDER_POLL_INTERVAL, max(0.0, row[0] - time.time()))
+
+    def _run_sender(self):
+        while True:
+            try:
+                self.process_due()
+                wait = self._next_due_in()
+            except Exception as e:
+                print(f"Slack sender error: {e}")
+                wait = SENDER_POLL_INTERVAL
+            self._wake.wait(wait)
+            self._wake.clear()
+
+    def start_sender(self):
+        """Start the background sender thread once per process; later calls do nothing."""
+        with self._sender_lock:
+            if self._sender is None or not self._sender.is_alive():
+                self._sender = threading.Thread(target=self._run_sender, name="slack-sender", daemon=True)
+                self._sender.start()
+
+
+@functools.lru_cache(maxsize=None)
+def slack_outbox() -> SlackOutbox:
+    """Process-wide outbox under CACHE_DIR."""
+    return SlackOutbox()
+
+
+def queue_posts(posts: Sequence[str], context: Optional[Dict] = None, images: Sequence[Tuple[str, bytes]] = ()) -> str:
+    """Queue a run's posts and images for Slack and return the delivery id without waiting for the send."""
+    outbox = slack_outbox()
+    delivery_id = outbox.enqueue(posts, context, images)
+    outbox.start_sender()
+    return delivery_id